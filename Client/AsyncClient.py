@@ -0,0 +1,226 @@
+import os
+import errno
+import socket
+import asyncio
+import logging
+import serial
+from Connection import AsyncConnection, ConnectionError, E_CONNECTION_ABORTED, E_CONNECTION_RESET
+from .Client import ClientError, UNUSED
+from .SocketClient import _SocketClient
+from .Errors import *
+from .Errors import _error2string
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+#
+# Define the asyncio client base class.
+#
+class AsyncClient(object):
+    def __init__(self, client_type, address, handler, reconnect):
+        if not callable(handler):
+            raise ClientError(E_HANDLER_NOT_CALLABLE, _error2string[E_HANDLER_NOT_CALLABLE])
+        self._client_type = client_type
+        self._address = address
+        self._handler = handler
+        self._reconnect = reconnect
+        self._task = None
+        self._closed = False
+
+    #
+    # Abstract coroutine that must be defined in a subclass.
+    #
+    # Open the connection to the server and return an AsyncConnection.
+    # Raise the exception given by _refused() when the server is not
+    # available.
+    #
+    async def _open(self):
+        raise NotImplementedError("%s: The _open() method shall be implemented in a subclass" % type(self).__name__)
+
+    #
+    # Return True when the exception means that the
+    # server is not available (yet).
+    #
+    @staticmethod
+    def _refused(e):
+        return isinstance(e, socket.error) and e.errno == errno.ECONNREFUSED
+
+    #
+    # Return True when the exception means that the
+    # connection was lost.
+    #
+    @staticmethod
+    def _lost(e):
+        if isinstance(e, ConnectionError):
+            return e.error_code == E_CONNECTION_RESET
+        return isinstance(e, socket.error) and e.errno in [errno.ECONNRESET, errno.EPIPE]
+
+    #
+    # Return True when the exception means that the
+    # connection was aborted.
+    #
+    @staticmethod
+    def _aborted(e):
+        if isinstance(e, ConnectionError):
+            return e.error_code == E_CONNECTION_ABORTED
+        return isinstance(e, socket.error) and e.errno == errno.ECONNABORTED
+
+    #
+    # Connect to the server, and run the specified handler coroutine for
+    # the connection. When reconnect is set to None, no attempt is made
+    # to reconnect when the connection is lost/refused; the exception
+    # will be re-raised in this case. When the reconnect setting is a
+    # float, automatically try to reconnect to the server. The reconnect
+    # value is used to throttle the reconnection attempts.
+    #
+    # When close() is called, the client disconnects from the server.
+    #
+    async def connect(self):
+        self._task = asyncio.current_task()
+        try:
+            while not self._closed:
+                try:
+                    connection = await self._open()
+                except Exception as e:
+                    if self._reconnect is not None and self._refused(e):
+                        logger.info("%s: connect() -- Service: %s not available, retrying in %f seconds.", type(self).__name__, str(self._address), self._reconnect)
+                        await asyncio.sleep(self._reconnect)                   # Throttle reconnection attempts.
+                        continue
+                    raise e                                                    # No reconnect requested, or no connection refused; re-raise the exception.
+                logger.info("%s: connect() -- Connected to server: %s", type(self).__name__, str(self._address))
+                status = 0
+                try:
+                    #
+                    # Connected to server, run the connection handler.
+                    #
+                    status = await self._handler(connection)
+                except Exception as e:
+                    if self._aborted(e):
+                        logger.info("%s: connect() -- %s.", type(self).__name__, e)
+                        break
+                    elif self._reconnect is not None and self._lost(e):
+                        logger.info("%s: connect() -- Lost connection to server: %s, reconnecting in: %f seconds.", type(self).__name__, str(self._address), self._reconnect)
+                        await asyncio.sleep(self._reconnect)                   # Throttle the reconnection attempts.
+                        continue
+                    raise e                                                    # No reconnect requested, or not connection reset; re-raise the exception.
+                else:
+                    break                                                      # The handler exited normally; exit.
+                finally:
+                    logger.info("%s: connect() -- Closing connection to: %s.", type(self).__name__, str(self._address))
+                    await connection.close()                                   # In all cases close the connection.
+                    self._close_connection()
+                    if not isinstance(status, int):
+                        status = 0                                             # When status is not integral, overrule.
+                    UNUSED(status)                                             # The returned status is currently not used.
+        except asyncio.CancelledError:
+            if not self._closed:
+                raise
+
+    #
+    # Close the underlying connection; nothing to do
+    # for socket clients.
+    #
+    def _close_connection(self):
+        pass
+
+    #
+    # Disconnect from the server. Must be called
+    # from the event loop thread.
+    #
+    def close(self):
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+
+    #
+    # Return an asyncio client instance corresponding to the specified client type.
+    # The handler must be a coroutine function that is called with an AsyncConnection.
+    # The specified client type is case insensitive and can be one of:
+    #
+    # * tcp : create a TCP/IP socket client.
+    # * unix: create a UNIX domain socket client.
+    # * serial: create a serial port client.
+    #
+    # noinspection SpellCheckingInspection
+    @classmethod
+    def create(cls, client_type, handler, *args, **kwargs):
+        #
+        # Map a client type to an instance of a corresponding client class.
+        #
+        client_type = client_type.lower()
+        _client_type2class = {
+            'tcp': lambda _handler, address, port, reconnect=None: _AsyncTCPSocketClient(client_type, _handler, address, port, reconnect),
+            'unix': lambda _handler, path, reconnect=None: _AsyncUNIXSocketClient(client_type, _handler, path, reconnect),
+            'serial': lambda _handler, port, reconnect=None, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False, rtscts=False, write_timeout=None, dsrdtr=False, inter_byte_timeout=None, exclusive=None: _AsyncSerialClient(client_type, _handler, reconnect, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+        }
+        return _client_type2class[client_type](handler, *args, **kwargs)
+
+
+#
+# Define an asyncio TCP/IP socket client.
+#
+class _AsyncTCPSocketClient(AsyncClient):
+    def __init__(self, client_type, handler, address, port, reconnect):
+        if not _SocketClient._is_ip_address(address):
+            raise ClientError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
+        if not isinstance(port, int):
+            raise ClientError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
+        super(_AsyncTCPSocketClient, self).__init__(client_type, (address, port), handler, reconnect)
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self._address[0], self._address[1])
+        return AsyncConnection.create(self._client_type, reader, writer, writer.get_extra_info('peername'))
+
+
+#
+# Define an asyncio Unix socket client.
+#
+class _AsyncUNIXSocketClient(AsyncClient):
+    def __init__(self, client_type, handler, path, reconnect):
+        if os.path.exists(path) and not _SocketClient._is_socket(path):
+            raise ClientError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
+        elif not os.path.exists(path):
+            raise ClientError(E_PATH_DOES_NOT_EXIST, _error2string[E_PATH_DOES_NOT_EXIST] % path)
+        super(_AsyncUNIXSocketClient, self).__init__(client_type, path, handler, reconnect)
+
+    async def _open(self):
+        reader, writer = await asyncio.open_unix_connection(self._address)
+        return AsyncConnection.create(self._client_type, reader, writer, self._address)
+
+
+#
+# Define an asyncio serial client.
+#
+class _AsyncSerialClient(AsyncClient):
+    #
+    # Initialize serial port, but do not open it yet.
+    #
+    # noinspection SpellCheckingInspection
+    def __init__(self, client_type, handler, reconnect, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive):
+        super(_AsyncSerialClient, self).__init__(client_type, port, handler, reconnect)
+        self._serial = serial.Serial(None, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+
+    #
+    # A serial port is not available when it does
+    # not exist or cannot be accessed.
+    #
+    @staticmethod
+    def _refused(e):
+        return isinstance(e, serial.SerialException) and e.errno in [errno.ENOENT, errno.EACCES]
+
+    async def _open(self):
+        self._serial.port = self._address
+        self._serial.open()
+        self._serial.reset_input_buffer()
+        self._serial.reset_output_buffer()
+        return AsyncConnection.create(self._client_type, self._serial)
+
+    #
+    # Close the connection and ignore any errors while doing so.
+    #
+    def _close_connection(self):
+        try:
+            self._serial.close()
+        except Exception as e:
+            UNUSED(e)
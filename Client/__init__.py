@@ -1,2 +1,3 @@
 from .Client import Client, ClientError
 from .Errors import *
+from .AsyncClient import AsyncClient
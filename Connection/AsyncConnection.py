@@ -0,0 +1,174 @@
+import os
+import socket
+import errno
+from .Connection import Connection, ConnectionError
+from .Errors import *
+from .Errors import _error2string
+
+
+#
+# Base class for asyncio connections. The connection reads from an
+# asyncio.StreamReader and writes to an asyncio.StreamWriter (or an
+# object with the same write(), drain() and close() interface). All
+# methods that wait for the peer are coroutines.
+#
+class AsyncConnection(object):
+    _chunk_size = 65536
+    _high_watermark = Connection._high_watermark
+    _low_watermark = Connection._high_watermark // 2
+
+    #
+    # Share the encoding helpers of the blocking connections.
+    #
+    _encode = staticmethod(Connection._encode)
+    _decoder = Connection._decoder
+    _decode = Connection._decode
+    set_buffer_limits = Connection.set_buffer_limits
+
+    #
+    # Share the line reader of the blocking connections, so the
+    # lines are split and decoded the same way.
+    #
+    _skip_line_feed = Connection._skip_line_feed
+    _find_line_end = Connection._find_line_end
+    _find_delimiter = Connection._find_delimiter
+    _slice_line_buffer = Connection._slice_line_buffer
+
+    def __init__(self, reader, writer, address):
+        self._reader = reader
+        self._writer = writer
+        self._address = address
+        self._line_buffer = bytearray()
+        self._line_scan = 0                                                    # Where the next line search resumes.
+        self._skip_lf = False                                                  # The last line ended with a '\r' at the end of the buffer.
+        self._line_truncated = False                                           # The decoder may hold part of a truncated line.
+        self._decoders = {}
+
+    #
+    # Return the exception that is raised when the
+    # peer closed the connection.
+    #
+    def _connection_reset(self):
+        return socket.error(errno.ECONNRESET, os.strerror(errno.ECONNRESET))
+
+    #
+    # Wait for more data from the peer and append it to the
+    # receive buffer. Raise a buffer overflow error when the
+    # receive buffer holds high watermark bytes or more.
+    #
+    async def _fill(self):
+        if len(self._line_buffer) >= self._high_watermark:
+            raise ConnectionError(E_BUFFER_OVERFLOW, _error2string[E_BUFFER_OVERFLOW] % self._high_watermark)
+        buffer = await self._reader.read(min(self._chunk_size, self._high_watermark - len(self._line_buffer)))
+        if len(buffer) == 0:
+            raise self._connection_reset()
+        self._line_buffer.extend(buffer)
+
+    #
+    # Send buffer to peer. If the encoding is not None,
+    # the buffer is encoded using the specified encoding.
+    # Otherwise the buffer is expected to be a bytes-object.
+    # Return when the buffer is handed to the transport and
+    # the transport is not above its write buffer limit.
+    #
+    async def send(self, buffer, encoding='utf8'):
+        self._writer.write(self._encode(buffer, encoding))
+        await self._writer.drain()
+
+    #
+    # Receive data from peer. If encoding is not None,
+    # the buffer is decoded using the specified encoding.
+    # Otherwise a bytes() object is returned.
+    #
+    async def receive(self, buffer_size=1024, encoding='utf8'):
+        buffer_size = max(1, buffer_size)                                      # Buffer size is at least 1 byte.
+        if len(self._line_buffer) == 0:
+            buffer = await self._reader.read(buffer_size)
+            if len(buffer) == 0:
+                raise self._connection_reset()
+        else:
+            buffer = self._line_buffer[:buffer_size]
+            del self._line_buffer[:buffer_size]
+            self._line_scan = 0
+        return self._decode(buffer, encoding)
+
+    #
+    # Receive a single line from peer. If buffer size is None,
+    # the line length is unlimited. If a buffer size is specified,
+    # the returned line may be truncated. In this situation the line
+    # may not contain a line terminator.
+    #
+    # When the delimiter is None and the encoding is not None, the
+    # universal newlines '\n', '\r\n' and '\r' terminate a line and
+    # are replaced by '\n'. Otherwise a line is terminated by the
+    # delimiter (b'\n' when the encoding is None), and the returned
+    # line includes the delimiter. See Connection.receive_line().
+    #
+    async def receive_line(self, buffer_size=None, encoding='utf8', delimiter=None):
+        if buffer_size is not None:
+            buffer_size = max(1, buffer_size)                                  # Buffer size is at least 1 byte.
+        if delimiter is not None or encoding is None:
+            delimiter = Connection._delimiter(b'\n' if delimiter is None else delimiter, encoding)
+        while True:
+            if delimiter is not None:
+                end = next_ = self._find_delimiter(delimiter, buffer_size)
+            else:
+                self._skip_line_feed()
+                end, next_ = self._find_line_end(buffer_size)
+            if end >= 0:
+                line = self._slice_line_buffer(end, encoding)
+                if delimiter is None:
+                    line += '\n'
+                break
+            if buffer_size is not None and len(self._line_buffer) >= buffer_size:
+                line, next_ = self._slice_line_buffer(buffer_size, encoding, True), buffer_size
+                break
+            await self._fill()
+        del self._line_buffer[:next_]
+        self._line_scan = 0
+        return line
+
+    #
+    # Receive one or more lines from peer. See receive_line()
+    # for a description of the parameters.
+    #
+    async def receive_lines(self, buffer_size=None, encoding='utf8', delimiter=None):
+        while True:
+            yield await self.receive_line(buffer_size, encoding, delimiter)
+
+    #
+    # Close the connection and ignore any errors
+    # while doing so.
+    #
+    async def close(self):
+        try:
+            self._writer.close()
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+
+    #
+    # Return an asyncio connection instance corresponding to the specified
+    # connection type. The specified connection type is case insensitive and
+    # can be one of:
+    #
+    # * tcp : create a TCP/IP connection from a (reader, writer) stream pair.
+    # * unix: create a UNIX domain connection from a (reader, writer) stream pair.
+    # * serial: create a serial port connection from an opened serial port. The
+    #           serial port is read by pyserial's reader thread, that feeds the
+    #           received data into the event loop. Must be called from a coroutine.
+    #
+    @classmethod
+    def create(cls, connection_type, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .AsyncSerialConnection import _AsyncSerialConnection
+
+        connection_type = connection_type.lower()
+        _connection_type2class = {
+            'tcp': lambda reader, writer, address: AsyncConnection(reader, writer, address),
+            'unix': lambda reader, writer, address: AsyncConnection(reader, writer, address),
+            'serial': lambda serial: _AsyncSerialConnection(serial)
+        }
+        return _connection_type2class[connection_type](*args, **kwargs)
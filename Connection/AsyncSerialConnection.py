@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from serial.threaded import Protocol
+from serial import SerialException
+from .AsyncConnection import AsyncConnection
+from .SerialConnection import _ExceptionReaderThread
+from .Connection import Connection, ConnectionError
+from .Errors import *
+from .Errors import _error2string
+
+
+#
+# Define a protocol that runs in pyserial's reader thread and
+# feeds the received data into an asyncio.StreamReader. The
+# stream reader is only touched from the event loop thread.
+#
+# The protocol is also the transport of the stream reader: the
+# stream reader pauses it when its buffer exceeds twice its limit,
+# and resumes it when the buffer drained to the limit. While paused,
+# the reader thread stops reading the serial port, so the serial
+# driver applies its flow control.
+#
+class _StreamReaderProtocol(Protocol):
+    def __init__(self, loop, reader):
+        super(_StreamReaderProtocol, self).__init__()
+        self._loop = loop
+        self._reader = reader
+        self._resumed = threading.Event()
+        self._resumed.set()
+        reader.set_transport(self)
+
+    #
+    # Called by the stream reader (event loop thread)
+    # when its buffer is full.
+    #
+    def pause_reading(self):
+        self._resumed.clear()
+
+    #
+    # Called by the stream reader (event loop thread) when
+    # its buffer has drained, and by stop().
+    #
+    def resume_reading(self):
+        self._resumed.set()
+
+    #
+    # Wake up the reader thread when it is paused, so it can be stopped.
+    #
+    def stop(self):
+        self._resumed.set()
+
+    #
+    # Called by the transport layer (thread) when bits of
+    # data are received. Hand them over to the event loop, and
+    # wait while the stream reader is paused.
+    #
+    def data_received(self, data):
+        self._loop.call_soon_threadsafe(self._reader.feed_data, data)
+        self._resumed.wait()
+
+    #
+    # Called when the connection is lost from reader thread.
+    #
+    def connection_lost(self, exception):
+        try:
+            self._loop.call_soon_threadsafe(self._reader.feed_eof)
+        except RuntimeError:
+            pass                                                               # The event loop is already closed.
+
+
+#
+# Define a stream writer for a serial port. The blocking serial
+# writes are run in an executor with a single thread, so the event
+# loop is never blocked, and the writes reach the serial port in
+# the order they were made.
+#
+class _SerialStreamWriter(object):
+    def __init__(self, loop, transport, protocol):
+        self._loop = loop
+        self._transport = transport
+        self._protocol = protocol
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+    #
+    # Write the data to the serial port in the background.
+    #
+    def write(self, data):
+        self._pending.append(self._loop.run_in_executor(self._executor, self._transport.write, data))
+
+    #
+    # Wait until all data is written.
+    #
+    async def drain(self):
+        pending, self._pending = self._pending, []
+        try:
+            for future in pending:
+                await future
+        except SerialException:
+            raise ConnectionError(E_CONNECTION_RESET, _error2string[E_CONNECTION_RESET])
+
+    #
+    # Nothing to do; the reader thread is stopped in wait_closed().
+    #
+    def close(self):
+        pass
+
+    #
+    # Stop the reader thread. Stopping joins the thread, so do it
+    # in the executor, after the pending writes.
+    #
+    async def wait_closed(self):
+        self._protocol.stop()
+        try:
+            await self._loop.run_in_executor(self._executor, self._transport.stop)
+        finally:
+            self._executor.shutdown(wait=False)
+
+
+#
+# Define an asyncio serial connection. Reading the serial
+# port is done in a separate thread by using ReaderThread().
+# No more than about the high watermark of received bytes
+# are buffered by the stream reader.
+#
+class _AsyncSerialConnection(AsyncConnection):
+    def __init__(self, serial_):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(max(1, Connection._high_watermark // 2), loop=loop)
+        protocol = _StreamReaderProtocol(loop, reader)
+        transport = _ExceptionReaderThread(serial_, lambda: protocol)
+        transport.start()
+        transport.connect()
+        super(_AsyncSerialConnection, self).__init__(reader, _SerialStreamWriter(loop, transport, protocol), serial_.port)
+
+    #
+    # Return the exception that is raised when the
+    # serial connection is lost.
+    #
+    def _connection_reset(self):
+        return ConnectionError(E_CONNECTION_RESET, _error2string[E_CONNECTION_RESET])
@@ -1,4 +1,6 @@
-from io import StringIO
+import time
+import codecs
+from io import IncrementalNewlineDecoder
 from .Errors import *
 from .Errors import _error2string
 
@@ -17,33 +19,78 @@ class ConnectionError(Exception):
 # Base class for connections.
 #
 class Connection(object):
+    _receive_size = 65536
+    _max_message_size = 16777216                                               # Default maximum message size (16 MiB).
+    _max_header_size = 10                                                      # Maximum size of a varint message header.
+    _high_watermark = _max_message_size + _max_header_size                     # Default maximum number of buffered received bytes; a message fits.
+    _blocking = True                                                           # False when the connection never waits for data.
+
     def __init__(self):
-        self._line_buffer = ''
+        self._line_buffer = bytearray()
+        self._line_scan = 0                                                    # Where the next newline search resumes.
+        self._skip_lf = False                                                  # The last line ended with a '\r' at the end of the buffer.
+        self._decoders = {}
+        self._line_truncated = False                                           # The decoder may hold part of a truncated line.
+        self._receive_chunk = None                                             # Reusable buffer the line buffer is filled from.
+        self._exact_buffer = None                                              # Reusable buffer for receive_exactly().
+        self._low_watermark = self._high_watermark // 2
 
     #
     # Encode a buffer for sending. Raise an exception
-    # when buffer has an invalid type.
+    # when buffer has an invalid type. A string is encoded
+    # using the specified encoding, a bytes-like object is
+    # returned as is.
     #
     @staticmethod
     def _encode(buffer, encoding='utf8'):
-        if not isinstance(buffer, (str, bytes, bytearray, memoryview)):
+        if isinstance(buffer, (bytes, bytearray, memoryview)):
+            return buffer
+        if not isinstance(buffer, str) or encoding is None:
             raise ConnectionError(E_INVALID_BUFFER_TYPE, _error2string[E_INVALID_BUFFER_TYPE])
-        return bytes(buffer, encoding)
+        return buffer.encode(encoding)
+
+    #
+    # Return the delimiter as a bytes object. Raise an exception
+    # when the delimiter is empty, or when it is a string and
+    # cannot be encoded.
+    #
+    @staticmethod
+    def _delimiter(delimiter, encoding):
+        if isinstance(delimiter, str) and encoding is not None:
+            delimiter = delimiter.encode(encoding)
+        if not isinstance(delimiter, (bytes, bytearray)) or len(delimiter) == 0:
+            raise ConnectionError(E_INVALID_DELIMITER, _error2string[E_INVALID_DELIMITER])
+        return bytes(delimiter)
+
+    #
+    # Return the incremental decoder for the specified encoding. The
+    # decoder keeps its state between received buffers, so a character
+    # that is split over two buffers is decoded correctly, and a '\r'
+    # at the end of a buffer is translated together with a '\n' at the
+    # start of the next buffer.
+    #
+    def _decoder(self, encoding):
+        decoder = self._decoders.get(encoding)
+        if decoder is None:
+            decoder = IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors='replace'), translate=True)
+            self._decoders[encoding] = decoder
+        return decoder
 
     #
     # Decode a received buffer. Raise an exception when
     # buffer has an invalid type. When encoding is not
-    # None, the buffer is decoded and the universal newlines
-    # are replaced by '\n'. When encoding is None, return a
-    # bytes object.
+    # None, the buffer is decoded with the incremental
+    # decoder of the connection and the universal newlines
+    # are replaced by '\n'. When encoding is None, return
+    # a bytes object.
     #
-    @staticmethod
-    def _decode(buffer, encoding='utf8'):
+    def _decode(self, buffer, encoding='utf8'):
         if not isinstance(buffer, (bytes, bytearray, memoryview)):
             raise ConnectionError(E_INVALID_BUFFER_TYPE, _error2string[E_INVALID_BUFFER_TYPE])
         if encoding is not None:
-            decoded = StringIO(str(buffer, encoding, errors='replace'), newline=None)
-            decoded = decoded.getvalue()
+            decoded = self._decoder(encoding).decode(buffer)
+        elif isinstance(buffer, bytes):
+            decoded = buffer                                                   # Already a bytes object; do not copy.
         else:
             decoded = bytes(buffer)
         return decoded
@@ -52,51 +99,423 @@ class Connection(object):
     # Send buffer to peer. If the encoding is not None,
     # the buffer is encoded using the specified encoding.
     # Otherwise the buffer is expected to be a bytes-object.
+    # When timeout is not None, give up after timeout seconds.
     #
-    def send(self, buffer, encoding='utf8'):
+    def send(self, buffer, encoding='utf8', timeout=None):
         raise NotImplementedError("%s: The send() method shall be implemented in a subclass" % type(self).__name__)
 
+    #
+    # Send all buffers in the iterable buffers to peer, as if they were
+    # concatenated. See send() for a description of the parameters. The
+    # buffers are joined and sent at once; subclasses may send them
+    # without joining them first.
+    #
+    def send_many(self, buffers, encoding='utf8', timeout=None):
+        self.send(b''.join([self._encode(buffer, encoding) for buffer in buffers]), None, timeout)
+
+    #
+    # Return a buffered writer for this connection. Data written to
+    # the writer is collected until flush() is called, or until more
+    # than buffer size bytes are pending, and is then sent at once with
+    # send_many(). When used as a context manager, the writer is flushed
+    # on exit.
+    #
+    def buffered_writer(self, buffer_size=65536, encoding='utf8'):
+        return _BufferedWriter(self, buffer_size, encoding)
+
     #
     # Receive data from peer. If encoding is not None,
     # the buffer is decoded using the specified encoding.
-    # Otherwise a bytes() object is returned.
+    # Otherwise a bytes() object is returned. When timeout is
+    # not None, give up after timeout seconds.
     #
-    def receive(self, buffer_size=1024, encoding='utf8'):
+    def receive(self, buffer_size=1024, encoding='utf8', timeout=None):
         raise NotImplementedError("%s: The receive() method shall be implemented in a subclass" % type(self).__name__)
 
     #
-    # Receive a single line of text from peer. The encoding
-    # must be a valid string and cannot be None. If buffer
-    # size is None, the line length is unlimited. If a buffer
-    # size is specified, the returned line may be truncated.
-    # In this situation the line may not contain a newline
-    # character.
+    # Remove at most buffer size bytes that were already received by
+    # the line reader from the line buffer, and return them decoded
+    # as by receive(). Return None when the line buffer is empty.
+    #
+    def _receive_line_buffer(self, buffer_size, encoding):
+        if len(self._line_buffer) == 0:
+            return None
+        buffer = self._line_buffer[:buffer_size]
+        del self._line_buffer[:buffer_size]
+        self._line_scan = 0
+        return self._decode(buffer, encoding)
+
+    #
+    # Abstract method that must be defined in a subclass.
+    #
+    # Receive data from peer directly into the writable memoryview
+    # view and return the number of bytes received. When timeout is
+    # not None, give up after timeout seconds.
+    #
+    def _receive_into(self, view, timeout=None):
+        raise NotImplementedError("%s: The _receive_into() method shall be implemented in a subclass" % type(self).__name__)
+
+    #
+    # Receive data from peer into buffer, a writable bytes-like object
+    # (e.g. a bytearray or memoryview), and return the number of bytes
+    # received. Data that was already received by the line reader is
+    # returned first. When timeout is not None, give up after timeout
+    # seconds.
+    #
+    def receive_into(self, buffer, timeout=None):
+        with memoryview(buffer) as view:
+            view = view.cast('B')
+            if len(self._line_buffer) == 0:
+                return self._receive_into(view, timeout)
+            size = min(len(view), len(self._line_buffer))
+            with memoryview(self._line_buffer) as line_view:
+                view[:size] = line_view[:size]
+            del self._line_buffer[:size]
+            self._line_scan = 0
+            return size
+
+    #
+    # Receive exactly size bytes from peer. The bytes are received into
+    # buffer when it is not None. Otherwise they are received into a
+    # reusable buffer of the connection, that is only valid until the
+    # next call. Return a memoryview of the received bytes. When timeout
+    # is not None, give up when not all bytes have been received after
+    # timeout seconds.
+    #
+    def receive_exactly(self, size, buffer=None, timeout=None):
+        if buffer is None:
+            if self._exact_buffer is None or len(self._exact_buffer) < size:
+                self._exact_buffer = bytearray(max(size, self._receive_size))
+            buffer = self._exact_buffer
+        deadline = None if timeout is None else time.monotonic() + timeout
+        view = memoryview(buffer).cast('B')[:size]
+        total = 0
+        while total < size:
+            total += self.receive_into(view[total:], None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return view
+
+    #
+    # Limit the number of received bytes the connection buffers. No more
+    # than high watermark bytes are read ahead into the line buffer; a
+    # line or message header that does not fit raises a buffer overflow
+    # error. Connections that receive data in the background (serial)
+    # stop reading, and assert flow control, when high watermark bytes
+    # are buffered, and resume when no more than low watermark bytes
+    # (half the high watermark when None) are left.
+    #
+    # A connection that does not block can only receive a message when
+    # the message and its header fit in the line buffer. The default
+    # maximum message size of receive_message() is therefore lowered to
+    # the high watermark minus the maximum header size, so larger
+    # messages raise a message too large error. A max size passed to
+    # receive_message() must not exceed it either.
+    #
+    def set_buffer_limits(self, high_watermark, low_watermark=None):
+        high_watermark = max(1, high_watermark)                                # Buffer at least 1 byte.
+        self._high_watermark = high_watermark
+        self._max_message_size = max(0, min(Connection._max_message_size, high_watermark - Connection._max_header_size))
+        self._low_watermark = high_watermark // 2 if low_watermark is None else min(max(0, low_watermark), high_watermark)
+
+    #
+    # Raise a buffer overflow error when the line buffer
+    # holds high watermark bytes or more.
     #
-    def receive_line(self, buffer_size=None, encoding='utf8'):
-        if encoding is None:
-            raise ConnectionError(E_INVALID_ENCODING_NONE, _error2string[E_INVALID_ENCODING_NONE])
+    def _check_buffer_overflow(self):
+        if len(self._line_buffer) >= self._high_watermark:
+            raise ConnectionError(E_BUFFER_OVERFLOW, _error2string[E_BUFFER_OVERFLOW] % self._high_watermark)
+
+    #
+    # Append received data to the line buffer, but never more than
+    # the high watermark allows. Return False when no data can be
+    # received without blocking.
+    #
+    def _fill_line_buffer(self, timeout=None):
+        self._check_buffer_overflow()
+        if self._receive_chunk is None:
+            self._receive_chunk = memoryview(bytearray(self._receive_size))
+        size = self._receive_into(self._receive_chunk[:self._high_watermark - len(self._line_buffer)], timeout)
+        self._line_buffer += self._receive_chunk[:size]
+        return True
+
+    #
+    # Drop the '\n' at the start of the line buffer when the previous
+    # line was terminated by a '\r' at the end of the line buffer.
+    #
+    def _skip_line_feed(self):
+        if self._skip_lf and len(self._line_buffer) != 0:
+            if self._line_buffer[0] == 0x0a:
+                del self._line_buffer[:1]                                      # Second half of a '\r\n' line terminator.
+            self._skip_lf = False
+
+    #
+    # Return the end of the first line in the line buffer and the
+    # offset of the data following its line terminator. The universal
+    # newlines '\n', '\r\n' and '\r' all terminate a line. Only the
+    # first limit bytes are searched, and the search resumes where the
+    # previous search stopped. Return (-1, -1) when no terminator is
+    # found.
+    #
+    def _find_line_end(self, limit):
+        buffer = self._line_buffer
+        end = len(buffer) if limit is None else min(len(buffer), limit)
+        nl = buffer.find(b'\n', self._line_scan, end)
+        cr = buffer.find(b'\r', self._line_scan, end if nl < 0 else nl)
+        if cr >= 0:
+            if cr + 1 < len(buffer):
+                return cr, cr + 2 if buffer[cr + 1] == 0x0a else cr + 1
+            self._skip_lf = True                                               # A '\n' may follow in the next chunk.
+            return cr, cr + 1
+        if nl >= 0:
+            return nl, nl + 1
+        self._line_scan = end
+        return -1, -1
+
+    #
+    # Return the offset of the data following the first delimiter
+    # in the line buffer. Only the first limit bytes are searched,
+    # and the search resumes where the previous search stopped.
+    # Return -1 when the delimiter is not found.
+    #
+    def _find_delimiter(self, delimiter, limit):
+        buffer = self._line_buffer
+        end = len(buffer) if limit is None else min(len(buffer), limit)
+        found = buffer.find(delimiter, max(0, self._line_scan - len(delimiter) + 1), end)
+        if found >= 0:
+            return found + len(delimiter)
+        self._line_scan = end
+        return -1
+
+    #
+    # Return the first size bytes of the line buffer; decoded when
+    # encoding is not None. The bytes are taken from a memoryview,
+    # so they are only copied once. The view is released before the
+    # line buffer is resized. A truncated line may end in the middle
+    # of a character, so it is decoded incrementally, as is the line
+    # following it.
+    #
+    def _slice_line_buffer(self, size, encoding, truncated=False):
+        with memoryview(self._line_buffer) as view:
+            if encoding is None:
+                return bytes(view[:size])
+            if truncated or self._line_truncated:
+                self._line_truncated = truncated
+                return self._decoder(encoding).decode(view[:size])
+            return str(view[:size], encoding, errors='replace')
+
+    #
+    # Receive a single line from peer. If buffer size is None,
+    # the line length is unlimited. If a buffer size is specified,
+    # the returned line may be truncated. In this situation the line
+    # may not contain a line terminator.
+    #
+    # When the delimiter is None and the encoding is not None, the
+    # universal newlines '\n', '\r\n' and '\r' terminate a line and
+    # are replaced by '\n'. Otherwise a line is terminated by the
+    # delimiter (b'\n' when the encoding is None), which can be any
+    # non-empty bytes object, or a string that is encoded using the
+    # encoding. The returned line includes the delimiter. When the
+    # encoding is None, a bytes object is returned.
+    #
+    # The received bytes are kept in the line buffer, and only
+    # complete lines are decoded. For a connection that does not
+    # block, None is returned when no complete line has been
+    # received yet.
+    #
+    def receive_line(self, buffer_size=None, encoding='utf8', delimiter=None):
         if buffer_size is not None:
-            buffer_size = max(1, buffer_size)                                          # Buffer size is at least 1 byte.
-        nl = self._line_buffer.find('\n')
-        while nl < 0:
-            self._line_buffer += self.receive(encoding=encoding)
-            nl = self._line_buffer.find('\n')
-            if buffer_size is not None and len(self._line_buffer) > buffer_size and (nl > buffer_size or nl < 0):
-                nl = buffer_size - 1
-        line, self._line_buffer = self._line_buffer[:nl + 1], self._line_buffer[nl + 1:]
+            buffer_size = max(1, buffer_size)                                  # Buffer size is at least 1 byte.
+        if delimiter is not None or encoding is None:
+            delimiter = self._delimiter(b'\n' if delimiter is None else delimiter, encoding)
+        while True:
+            if delimiter is not None:
+                end = next_ = self._find_delimiter(delimiter, buffer_size)
+            else:
+                self._skip_line_feed()
+                end, next_ = self._find_line_end(buffer_size)
+            if end >= 0:
+                line = self._slice_line_buffer(end, encoding)
+                if delimiter is None:
+                    line += '\n'
+                break
+            if buffer_size is not None and len(self._line_buffer) >= buffer_size:
+                line, next_ = self._slice_line_buffer(buffer_size, encoding, True), buffer_size
+                break
+            if not self._fill_line_buffer():
+                return None
+        del self._line_buffer[:next_]                                          # Deleting from the front does not copy the remainder.
+        self._line_scan = 0
         return line
 
     #
-    # Receive one or more lines of text from peer. The encoding
-    # must be a valid string and cannot be None. If buffer
-    # size is None, the line length is unlimited. If a buffer
-    # size is specified, the returned line may be truncated.
-    # In this situation the line may not contain a newline
-    # character.
+    # Return the offset of the data following the last line terminator
+    # in the line buffer; the universal newlines when the delimiter is
+    # None. The search starts where the previous search stopped. Return
+    # -1 when the line buffer holds no complete line.
+    #
+    def _find_batch_end(self, delimiter):
+        buffer = self._line_buffer
+        if delimiter is None:
+            end = max(buffer.rfind(b'\n', self._line_scan), buffer.rfind(b'\r', self._line_scan)) + 1
+        else:
+            end = buffer.rfind(delimiter, max(0, self._line_scan - len(delimiter) + 1))
+            end = end + len(delimiter) if end >= 0 else 0
+        if end == 0:
+            self._line_scan = len(buffer)
+            return -1
+        return end
+
+    #
+    # Split the first size bytes of the line buffer, which end with a
+    # line terminator, into lines with a single split() pass. When the
+    # encoding is not None, the bytes are decoded at once.
+    #
+    def _split_line_buffer(self, size, encoding, delimiter):
+        with memoryview(self._line_buffer) as view:
+            if delimiter is None:
+                text = str(view[:size], encoding, errors='replace')
+                if '\r' in text:
+                    text = text.replace('\r\n', '\n').replace('\r', '\n')
+                self._skip_lf = view[size - 1] == 0x0d                         # Size is the end of the buffer in this case.
+                terminator = '\n'
+            elif encoding is None:
+                text, terminator = bytes(view[:size]), delimiter
+            else:
+                text, terminator = str(view[:size], encoding, errors='replace'), str(delimiter, encoding)
+        lines = text.split(terminator)
+        lines.pop()                                                            # The empty string following the last terminator.
+        return [line + terminator for line in lines]
+
+    #
+    # Receive all complete lines that are available from peer, and
+    # return them as a list. Wait for a line when none is available.
+    # See receive_line() for a description of the parameters. The
+    # received data is split into lines with a single split() pass;
+    # only the trailing partial line is kept in the line buffer. If a
+    # buffer size is specified, a partial line that reaches the buffer
+    # size is returned truncated; complete lines are never truncated.
+    #
+    # For a connection that does not block, an empty list is returned
+    # when no complete line has been received yet.
+    #
+    def receive_line_batch(self, buffer_size=None, encoding='utf8', delimiter=None):
+        if delimiter is not None or encoding is None:
+            delimiter = self._delimiter(b'\n' if delimiter is None else delimiter, encoding)
+        lines = []
+        if self._line_truncated or self._find_batch_end(delimiter) < 0:
+            line = self.receive_line(buffer_size, encoding, delimiter)         # Wait for the first line.
+            if line is None:
+                return lines
+            lines.append(line)
+        if self._line_truncated:
+            return lines                                                       # The rest of the truncated line is decoded incrementally.
+        if delimiter is None:
+            self._skip_line_feed()
+        end = self._find_batch_end(delimiter)
+        if end > 0:
+            lines.extend(self._split_line_buffer(end, encoding, delimiter))
+            del self._line_buffer[:end]
+            self._line_scan = 0
+        return lines
+
     #
-    def receive_lines(self, buffer_size=None, encoding='utf8'):
+    # Receive one or more lines from peer. See receive_line()
+    # for a description of the parameters. When batch is True,
+    # yield lists of lines as returned by receive_line_batch().
+    # For a connection that does not block, stop when no complete
+    # line has been received yet.
+    #
+    def receive_lines(self, buffer_size=None, encoding='utf8', delimiter=None, batch=False):
+        while True:
+            if batch:
+                line = self.receive_line_batch(buffer_size, encoding, delimiter)
+            else:
+                line = self.receive_line(buffer_size, encoding, delimiter)
+            if not line:
+                return
+            yield line
+
+    #
+    # Send buffer to peer as a single message. The message is preceded
+    # by a header holding the size of the (encoded) buffer as a varint:
+    # 7 bits per byte, least significant group first, with the high bit
+    # set on all but the last byte. When timeout is not None, give up
+    # after timeout seconds.
+    #
+    def send_message(self, buffer, encoding='utf8', timeout=None):
+        buffer = self._encode(buffer, encoding)
+        size = buffer.nbytes if isinstance(buffer, memoryview) else len(buffer)
+        self.send_many((self._message_header(size), buffer), None, timeout)
+
+    #
+    # Return the varint message header for a message of size bytes.
+    #
+    @staticmethod
+    def _message_header(size):
+        header = bytearray()
+        while size > 0x7f:
+            header.append(0x80 | (size & 0x7f))
+            size >>= 7
+        header.append(size)
+        return header
+
+    #
+    # Return the size of the next message and the size of its header,
+    # without removing the header from the line buffer. Return None
+    # when a connection that does not block has not received the
+    # complete header yet.
+    #
+    def _peek_message_header(self, deadline):
+        size, shift, index = 0, 0, 0
         while True:
-            yield self.receive_line(buffer_size, encoding)
+            while index >= len(self._line_buffer):
+                if not self._fill_line_buffer(None if deadline is None else max(0.0, deadline - time.monotonic())):
+                    return None
+            byte = self._line_buffer[index]
+            size |= (byte & 0x7f) << shift
+            index += 1
+            if byte & 0x80 == 0:
+                return size, index
+            shift += 7
+            if shift > 63:
+                raise ConnectionError(E_INVALID_MESSAGE_HEADER, _error2string[E_INVALID_MESSAGE_HEADER])
+
+    #
+    # Receive a single message from peer, as sent by send_message().
+    # Return a memoryview of the message in a reusable buffer of the
+    # connection, that is only valid until the next call. Raise an
+    # exception when the message is larger than max size bytes (16 MiB
+    # when None); the connection cannot be used after that. When timeout
+    # is not None, give up after timeout seconds. For a connection that
+    # does not block, None is returned when the complete message has
+    # not been received yet.
+    #
+    def receive_message(self, max_size=None, timeout=None):
+        max_size = self._max_message_size if max_size is None else max_size
+        deadline = None if timeout is None else time.monotonic() + timeout
+        header = self._peek_message_header(deadline)
+        if header is None:
+            return None
+        size, header_size = header
+        if size > max_size:
+            raise ConnectionError(E_MESSAGE_TOO_LARGE, _error2string[E_MESSAGE_TOO_LARGE] % (size, max_size))
+        if not self._blocking and len(self._line_buffer) < header_size + size:
+            return None                                                        # Leave the header until the message is complete.
+        del self._line_buffer[:header_size]
+        self._line_scan = 0
+        return self.receive_exactly(size, None, None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    #
+    # Receive one or more messages from peer. See receive_message()
+    # for a description of the parameters. Each message is only valid
+    # until the next one is received. For a connection that does not
+    # block, stop when no complete message has been received yet.
+    #
+    def receive_messages(self, max_size=None):
+        while True:
+            message = self.receive_message(max_size)
+            if message is None:
+                return
+            yield message
 
     #
     # When True a disconnect is requested. This property should
@@ -137,3 +556,100 @@ class Connection(object):
             'serial': lambda serial, disconnect: _SerialConnection(serial, disconnect)
         }
         return _server_type2class[connection_type](*args, **kwargs)
+
+    #
+    # Return an evented connection instance corresponding to the specified
+    # connection type. An evented connection never blocks and is driven by
+    # the selector loop of an evented server. The specified connection type
+    # is case insensitive and can be one of:
+    #
+    # * tcp : create a TCP/IP connection.
+    # * unix: create a UNIX domain connection.
+    #
+    @classmethod
+    def create_evented(cls, connection_type, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .SocketConnection import _EventedSocketConnection
+
+        connection_type = connection_type.lower()
+        _server_type2class = {
+            'tcp': lambda socket, address, disconnect: _EventedSocketConnection(socket, address, disconnect),
+            'unix': lambda socket, address, disconnect: _EventedSocketConnection(socket, address, disconnect)
+        }
+        return _server_type2class[connection_type](*args, **kwargs)
+
+    #
+    # Return a multiplexed connection instance corresponding to the specified
+    # connection type. The connection does not read by itself; the selector
+    # loop of a multi-port server reads the port and feeds the received data
+    # into the connection. The specified connection type is case insensitive
+    # and can be one of:
+    #
+    # * serial: create a serial port connection.
+    #
+    @classmethod
+    def create_multiplexed(cls, connection_type, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .SerialConnection import _MultiplexedSerialConnection
+
+        connection_type = connection_type.lower()
+        _server_type2class = {
+            'serial': lambda serial, disconnect: _MultiplexedSerialConnection(serial, disconnect)
+        }
+        return _server_type2class[connection_type](*args, **kwargs)
+
+
+#
+# Define a buffered writer. Small buffers are copied into a single
+# bytearray, large buffers are kept as they are, so flush() hands a
+# short list of buffers to Connection.send_many() without copying
+# the large ones. A large buffer is kept as a read-only memoryview, so
+# small buffers are only ever appended to bytearrays of the writer;
+# it must not be modified by the caller until it is flushed.
+#
+class _BufferedWriter(object):
+    _copy_size = 1024                                                          # Buffers smaller than this are copied.
+
+    def __init__(self, connection, buffer_size, encoding):
+        self._connection = connection
+        self._buffer_size = buffer_size
+        self._encoding = encoding
+        self._buffers = []
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    #
+    # Add buffer to the pending data. Flush when more than
+    # buffer size bytes are pending.
+    #
+    def write(self, buffer, encoding=None):
+        buffer = self._connection._encode(buffer, self._encoding if encoding is None else encoding)
+        size = buffer.nbytes if isinstance(buffer, memoryview) else len(buffer)
+        if size < self._copy_size and len(self._buffers) != 0 and isinstance(self._buffers[-1], bytearray):
+            self._buffers[-1] += buffer
+        elif size < self._copy_size:
+            self._buffers.append(bytearray(buffer))
+        else:
+            self._buffers.append(memoryview(buffer).toreadonly())              # Never appended to; see above.
+        self._pending += size
+        if self._pending > self._buffer_size:
+            self.flush()
+
+    #
+    # Send all pending data. When timeout is not None,
+    # give up after timeout seconds.
+    #
+    def flush(self, timeout=None):
+        if len(self._buffers) != 0:
+            buffers, self._buffers, self._pending = self._buffers, [], 0
+            self._connection.send_many(buffers, None, timeout)
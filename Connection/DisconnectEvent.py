@@ -0,0 +1,98 @@
+import os
+import select
+import weakref
+
+_events = weakref.WeakSet()                                                    # All disconnect events of this process.
+
+
+#
+# Mark the disconnect events that a forked child process inherits from
+# its parent. These can be set by the parent, which the flag of the
+# child does not show.
+#
+def _inherit_events():
+    for event in _events:
+        event._inherited = True
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_inherit_events)
+
+
+#
+# Define a disconnect event. The event is set once to request a
+# disconnect. Besides a flag, the event holds a pipe that becomes
+# readable when the event is set. A connection can therefore wait for
+# the event together with its socket in a single poll() call, instead
+# of polling a disconnect callable. As the pipe is inherited by forked
+# child processes, setting the event in the parent is seen by the
+# children as well.
+#
+# A disconnect event is callable and returns True when it is set, so it
+# can be used anywhere a disconnect callable is expected.
+#
+class DisconnectEvent(object):
+    def __init__(self):
+        self._is_set = False
+        self._inherited = False
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._write_fd, False)
+        _events.add(self)
+
+    #
+    # Return True when the event is set.
+    #
+    def __call__(self):
+        return self.is_set()
+
+    #
+    # Return the file descriptor that becomes readable
+    # when the event is set.
+    #
+    def fileno(self):
+        return self._read_fd
+
+    #
+    # Return True when the event is set. Within the process that created
+    # the event the flag suffices, so checking the event costs no system
+    # call. A forked child process checks the pipe, as its parent may
+    # set the event.
+    #
+    def is_set(self):
+        if not self._is_set and self._inherited:
+            self._is_set = self.wait(0.0)
+        return self._is_set
+
+    #
+    # Set the event. The pipe is never drained, so it stays
+    # readable for all waiting threads and processes.
+    #
+    def set(self):
+        if not self._is_set:
+            self._is_set = True
+            try:
+                os.write(self._write_fd, b'\0')
+            except (BlockingIOError, OSError):
+                pass                                                           # The pipe is full or closed; the event is already set.
+
+    #
+    # Wait until the event is set or the timeout (in seconds) expires.
+    # When timeout is None, wait forever. Return True when the event
+    # is set.
+    #
+    def wait(self, timeout=None):
+        if self._is_set:
+            return True
+        poller = select.poll()
+        poller.register(self._read_fd, select.POLLIN)
+        return len(poller.poll(None if timeout is None else timeout * 1000.0)) != 0
+
+    #
+    # Close the pipe.
+    #
+    def close(self):
+        for fd in (self._read_fd, self._write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
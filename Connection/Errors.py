@@ -3,11 +3,25 @@ E_INVALID_ENCODING_NONE = 2
 E_PARAMETER_IS_NOT_CALLABLE = 3
 E_CONNECTION_ABORTED = 4
 E_CONNECTION_RESET = 5
+E_CONNECTION_TIMEOUT = 6
+E_INVALID_DELIMITER = 7
+E_MESSAGE_TOO_LARGE = 8
+E_INVALID_MESSAGE_HEADER = 9
+E_BUFFER_OVERFLOW = 10
+E_INVALID_FRAME = 11
+E_SEND_BUFFER_OVERFLOW = 12
 
 _error2string = {
     E_INVALID_BUFFER_TYPE: "Invalid buffer type",
     E_INVALID_ENCODING_NONE: "The encoding cannot be None",
     E_PARAMETER_IS_NOT_CALLABLE: "Callable expected for parameter: '%s'",
     E_CONNECTION_ABORTED: "The connection is aborted by software",
-    E_CONNECTION_RESET: "The connection was reset"
+    E_CONNECTION_RESET: "The connection was reset",
+    E_CONNECTION_TIMEOUT: "The connection timed out",
+    E_INVALID_DELIMITER: "The delimiter shall be a non-empty bytes object, or a string when the encoding is not None",
+    E_MESSAGE_TOO_LARGE: "Message size (%d) exceeds the maximum message size (%d)",
+    E_INVALID_MESSAGE_HEADER: "Invalid message header",
+    E_BUFFER_OVERFLOW: "Receive buffer overflow, more than %d bytes buffered",
+    E_INVALID_FRAME: "Invalid multiplexer frame",
+    E_SEND_BUFFER_OVERFLOW: "Send buffer overflow, more than %d bytes queued"
 }
@@ -0,0 +1,542 @@
+import time
+import errno
+import select
+import socket
+import struct
+import logging
+import threading
+from collections import deque
+from .Connection import Connection, ConnectionError
+from .SerialConnection import _BufferProtocol
+from .Errors import *
+from .Errors import _error2string
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#
+# Frame types. Each frame is sent as a single message (see
+# Connection.send_message()), that starts with a frame header
+# holding the channel id and the frame type.
+#
+_OPEN = 0                                                                      # Open a channel.
+_DATA = 1                                                                      # Channel data.
+_WINDOW = 2                                                                    # Grant the peer more send credit.
+_CLOSE = 3                                                                     # Close a channel; channel 0 closes the multiplexer.
+_frame_header = struct.Struct('!IB')
+_window_update = struct.Struct('!I')
+
+
+#
+# Define a channel multiplexer. The multiplexer runs many logical,
+# bidirectional channels over a single blocking connection (e.g. a TCP
+# socket or a serial link). Either side can open() a channel; the peer
+# accept()s it. Each channel is a Connection of its own, so it can be
+# handed to an existing connection handler.
+#
+# A reader thread receives the frames from the connection and appends
+# the data to the receive buffer of its channel. A writer thread sends
+# the queued frames: control frames first, then at most _frame_size
+# bytes of each channel with pending data in turn (round robin), so a
+# channel that sends a lot of data does not starve the other channels.
+# Frames are sent in batches of at most _batch_size bytes with a single
+# send_many() call.
+#
+# Each channel has a flow control window of window bytes in either
+# direction: a side never sends more data than the peer has granted,
+# and the peer grants more as soon as its handler consumed half of the
+# window. A channel that is not read therefore never blocks the other
+# channels, and its receive buffer never holds more than window bytes.
+# Sending blocks while window bytes are queued for a channel.
+#
+# The client uses odd channel ids, the server even channel ids, so both
+# sides can open channels at the same time.
+#
+class Multiplexer(object):
+    _frame_size = 16384
+    _batch_size = 65536
+
+    def __init__(self, connection, client=True, window=262144, max_channels=None):
+        self._connection = connection
+        self._window = max(self._frame_size, window)
+        self._max_channels = max_channels                                      # Maximum number of accepted channels; None when unlimited.
+        self._condition = threading.Condition()                                # Guards the state of the multiplexer and its channels.
+        self._channels = {}
+        self._next_id = 1 if client else 2
+        self._accepted = deque()                                               # Channels opened by the peer, not accepted yet.
+        self._control = deque()                                                # Control frames to send.
+        self._ready = deque()                                                  # Channels with pending data and send credit.
+        self._closing = False                                                  # Close the multiplexer when all data is sent.
+        self._failed = False                                                   # The connection failed; nothing can be sent.
+        self._error = None                                                     # Error code of the stopped multiplexer.
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._reader.start()
+        self._writer.start()
+
+    #
+    # Return the buffers of a frame.
+    #
+    @staticmethod
+    def _frame(channel_id, frame_type, payload=b''):
+        return [Connection._message_header(_frame_header.size + len(payload)), _frame_header.pack(channel_id, frame_type), payload]
+
+    #
+    # Queue a control frame. Must be called with the condition held.
+    #
+    def _queue(self, channel_id, frame_type, payload=b''):
+        self._control.append(self._frame(channel_id, frame_type, payload))
+        self._condition.notify_all()
+
+    #
+    # Schedule channel for sending, when it has pending data and send
+    # credit and is not scheduled yet. Must be called with the condition
+    # held.
+    #
+    def _schedule(self, channel):
+        if not channel._scheduled and channel._pending_size > 0 and channel._credit > 0:
+            channel._scheduled = True
+            self._ready.append(channel)
+            self._condition.notify_all()
+
+    #
+    # Stop the multiplexer with the specified error code: wake up
+    # all waiting threads, and discard the pending data. When failed
+    # is True, the connection cannot be used anymore.
+    #
+    def _stop(self, error_code, failed):
+        with self._condition:
+            if self._error is None:
+                self._error = error_code
+            self._failed = self._failed or failed
+            for channel in self._channels.values():
+                channel._pending.clear()
+                channel._pending_size = 0
+                channel._protocol.connection_lost(None)
+            self._ready.clear()
+            self._condition.notify_all()
+
+    #
+    # Return the exception raised by an operation on a closed channel.
+    #
+    def _channel_error(self, channel):
+        if channel._local_closed:
+            error_code = E_CONNECTION_ABORTED
+        elif self._error is not None:
+            error_code = self._error
+        else:
+            error_code = E_CONNECTION_RESET                                    # The peer closed the channel.
+        return ConnectionError(error_code, _error2string[error_code])
+
+    #
+    # Create a channel. Must be called with the condition held.
+    #
+    def _create_channel(self, channel_id):
+        channel = _Channel(self, channel_id, self._window)
+        self._channels[channel_id] = channel
+        return channel
+
+    #
+    # Open a new channel and return it.
+    #
+    def open(self):
+        with self._condition:
+            if self._error is not None or self._closing:
+                error_code = E_CONNECTION_ABORTED if self._error is None else self._error
+                raise ConnectionError(error_code, _error2string[error_code])
+            channel = self._create_channel(self._next_id)
+            self._next_id += 2
+            self._queue(channel.id, _OPEN)
+            return channel
+
+    #
+    # Wait until the peer opened a channel and return it. Raise an
+    # exception when the multiplexer is stopped, and a timeout error
+    # when no channel is opened within timeout seconds. When timeout
+    # is None, wait forever.
+    #
+    def accept(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._accepted) != 0 or self._error is not None or self._closing, timeout):
+                raise ConnectionError(E_CONNECTION_TIMEOUT, _error2string[E_CONNECTION_TIMEOUT])
+            if len(self._accepted) != 0:
+                return self._accepted.popleft()
+            error_code = E_CONNECTION_ABORTED if self._error is None else self._error
+            raise ConnectionError(error_code, _error2string[error_code])
+
+    #
+    # Close the multiplexer: close all channels, send their pending data,
+    # and tell the peer to close the multiplexer as well. Wait at most
+    # timeout seconds for the peer (forever when None). When the peer did
+    # not confirm the close in time, the multiplexer is stopped as if the
+    # connection failed; its threads end when the connection is closed.
+    # The connection itself is not closed.
+    #
+    def close(self, timeout=10.0):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._closing = True
+            for channel in list(self._channels.values()):
+                self._close_channel(channel)
+            self._condition.notify_all()
+        for thread in (self._writer, self._reader):
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if self._writer.is_alive() or self._reader.is_alive():
+            logger.info("%s: close() -- The peer did not confirm the close within %.1f seconds.", type(self).__name__, timeout)
+            self._stop(E_CONNECTION_ABORTED, True)
+        else:
+            self._stop(E_CONNECTION_ABORTED, False)
+
+    #
+    # Close channel. Its pending data is still sent, followed by
+    # a close frame.
+    #
+    def _close_channel(self, channel):
+        with self._condition:
+            if channel._local_closed:
+                return
+            channel._local_closed = True
+            channel._protocol.read(len(channel._protocol))                     # Discard the received data,
+            channel._protocol.connection_lost(None)                            # and wake up the readers of the channel.
+            if not channel._remote_closed and channel._receive_window < self._window and not self._failed:
+                self._queue(channel.id, _WINDOW, _window_update.pack(self._window - channel._receive_window))
+                channel._receive_window = self._window                         # The peer must not block on data that is never read.
+            if channel._remote_closed:
+                channel._pending.clear()
+                channel._pending_size = 0
+            if channel._pending_size == 0:
+                self._send_close(channel)
+            self._condition.notify_all()
+
+    #
+    # Queue the close frame of channel, and forget the channel when the
+    # peer closed it as well. Must be called with the condition held.
+    #
+    def _send_close(self, channel):
+        if self._failed or channel._close_sent:
+            return
+        channel._close_sent = True
+        self._queue(channel.id, _CLOSE)
+        if channel._remote_closed:
+            self._channels.pop(channel.id, None)
+
+    #
+    # Queue the data in view for sending on channel. Wait while
+    # window bytes are queued for the channel. Raise a timeout error
+    # when the data could not be queued within timeout seconds.
+    #
+    def _send(self, channel, view, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        offset = 0
+        with self._condition:
+            while offset < len(view):
+                if self._error is not None or channel._local_closed or channel._remote_closed:
+                    raise self._channel_error(channel)
+                room = self._window - channel._pending_size
+                if room <= 0:
+                    wait = None if deadline is None else deadline - time.monotonic()
+                    if wait is not None and wait <= 0.0:
+                        raise ConnectionError(E_CONNECTION_TIMEOUT, _error2string[E_CONNECTION_TIMEOUT])
+                    self._condition.wait(wait)
+                    continue
+                piece = view[offset:offset + room]
+                channel._pending.append(piece)
+                channel._pending_size += len(piece)
+                offset += len(piece)
+                self._schedule(channel)
+
+    #
+    # Return True when data can be queued for channel without waiting.
+    #
+    def _writable(self, channel):
+        with self._condition:
+            return channel._pending_size < self._window
+
+    #
+    # Called when the handler of channel consumed size bytes. Grant
+    # the peer more send credit when half of the window is consumed.
+    #
+    def _consumed(self, channel, size):
+        with self._condition:
+            channel._consumed += size
+            if channel._consumed >= self._window // 2 and not channel._remote_closed and not channel._local_closed and self._error is None:
+                channel._receive_window += channel._consumed
+                self._queue(channel.id, _WINDOW, _window_update.pack(channel._consumed))
+                channel._consumed = 0
+
+    #
+    # Handle a frame received from the peer.
+    #
+    def _dispatch(self, channel_id, frame_type, payload):
+        with self._condition:
+            if channel_id == 0:
+                if frame_type != _CLOSE:
+                    raise ConnectionError(E_INVALID_FRAME, _error2string[E_INVALID_FRAME])
+                return False                                                   # The peer closed the multiplexer.
+            channel = self._channels.get(channel_id)
+            if frame_type == _OPEN:
+                if channel is not None or channel_id % 2 == self._next_id % 2:
+                    raise ConnectionError(E_INVALID_FRAME, _error2string[E_INVALID_FRAME])
+                accepted = sum(1 for channel in self._channels.values() if channel.id % 2 != self._next_id % 2)
+                if self._closing or (self._max_channels is not None and accepted >= self._max_channels):
+                    self._queue(channel_id, _CLOSE)                            # Refuse the channel.
+                else:
+                    self._accepted.append(self._create_channel(channel_id))
+                    self._condition.notify_all()
+            elif channel is None:
+                pass                                                           # The channel was refused or closed.
+            elif frame_type == _DATA:
+                if channel._local_closed:
+                    if len(payload) != 0:
+                        self._queue(channel_id, _WINDOW, _window_update.pack(len(payload)))
+                    return True                                                # Nobody reads the data anymore; discard it.
+                if len(payload) > channel._receive_window:
+                    raise ConnectionError(E_INVALID_FRAME, _error2string[E_INVALID_FRAME])
+                channel._receive_window -= len(payload)
+                channel._protocol.feed(payload)
+            elif frame_type == _WINDOW:
+                channel._credit += _window_update.unpack(payload)[0]
+                self._schedule(channel)
+            elif frame_type == _CLOSE:
+                channel._remote_closed = True
+                channel._pending.clear()
+                channel._pending_size = 0
+                channel._protocol.connection_lost(None)
+                if channel._close_sent:
+                    del self._channels[channel_id]
+                self._condition.notify_all()
+            else:
+                raise ConnectionError(E_INVALID_FRAME, _error2string[E_INVALID_FRAME])
+            return True
+
+    #
+    # Reader thread: receive the frames until the peer closes the
+    # multiplexer, or the connection fails.
+    #
+    def _read(self):
+        try:
+            while True:
+                message = self._connection.receive_message(_frame_header.size + self._frame_size)
+                if len(message) < _frame_header.size:
+                    raise ConnectionError(E_INVALID_FRAME, _error2string[E_INVALID_FRAME])
+                channel_id, frame_type = _frame_header.unpack_from(message)
+                if not self._dispatch(channel_id, frame_type, bytes(message[_frame_header.size:])):
+                    break
+        except ConnectionError as e:
+            self._stop(e.error_code, True)
+            return
+        except socket.error as e:
+            self._stop(E_CONNECTION_ABORTED if e.errno == errno.ECONNABORTED else E_CONNECTION_RESET, True)
+            return
+        self._stop(E_CONNECTION_RESET, False)
+        with self._condition:
+            self._closing = True                                               # Confirm the close to the peer.
+            self._condition.notify_all()
+
+    #
+    # Writer thread: send the control frames, and the pending data of
+    # the channels in turn, until the multiplexer is closed.
+    #
+    def _write(self):
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._failed or len(self._control) != 0 or len(self._ready) != 0 or (self._closing and not self._pending()))
+                    if self._failed:
+                        return
+                    buffers, size = [], 0
+                    while size < self._batch_size and (len(self._control) != 0 or len(self._ready) != 0):
+                        if len(self._control) != 0:
+                            buffers.extend(self._control.popleft())
+                            continue
+                        channel = self._ready.popleft()
+                        channel._scheduled = False
+                        chunk = channel._pending[0]
+                        piece = chunk[:min(len(chunk), channel._credit, self._frame_size)]
+                        if len(piece) == len(chunk):
+                            channel._pending.popleft()
+                        else:
+                            channel._pending[0] = chunk[len(piece):]
+                        channel._pending_size -= len(piece)
+                        channel._credit -= len(piece)
+                        buffers.extend(self._frame(channel.id, _DATA, piece))
+                        size += len(piece)
+                        if channel._pending_size == 0 and channel._local_closed:
+                            self._send_close(channel)
+                        self._schedule(channel)                                # Back of the queue: round robin.
+                    done = len(buffers) == 0
+                    if done:
+                        buffers = self._frame(0, _CLOSE)                       # Everything is sent; close the multiplexer.
+                    self._condition.notify_all()                               # Wake up senders waiting for room.
+                self._connection.send_many(buffers, None)
+                if done:
+                    return
+        except ConnectionError as e:
+            self._stop(e.error_code, True)
+        except socket.error as e:
+            self._stop(E_CONNECTION_ABORTED if e.errno == errno.ECONNABORTED else E_CONNECTION_RESET, True)
+
+    #
+    # Return True when a channel has data to send. Must be called
+    # with the condition held.
+    #
+    def _pending(self):
+        return len(self._control) != 0 or len(self._ready) != 0 or any(channel._pending_size != 0 for channel in self._channels.values())
+
+    #
+    # Return a connection handler that runs a multiplexer (as server)
+    # over its connection, and calls handler with each channel that the
+    # client opens, in a thread per channel. The returned handler can be
+    # passed to any server that runs blocking handlers (iterative,
+    # threading, forking, pooled, ...), so a single serial link or socket
+    # carries many concurrent request streams.
+    #
+    @classmethod
+    def create_handler(cls, handler, window=262144, max_channels=None):
+        def _handler(connection):
+            multiplexer = cls(connection, False, window, max_channels)
+            threads = []
+            try:
+                while True:
+                    try:
+                        channel = multiplexer.accept()
+                    except ConnectionError:
+                        break                                                  # The client closed the multiplexer, or the connection ended.
+                    thread = threading.Thread(target=cls._handle_channel, args=(handler, channel), daemon=True)
+                    thread.start()
+                    threads = [thread for thread in threads if thread.is_alive()] + [thread]
+            finally:
+                multiplexer.close()
+                for thread in threads:
+                    thread.join()
+            return 0
+        return _handler
+
+    #
+    # Call handler with channel, and close the channel when it returns.
+    #
+    @classmethod
+    def _handle_channel(cls, handler, channel):
+        try:
+            handler(channel)
+        except ConnectionError as e:
+            if e.error_code not in [E_CONNECTION_RESET, E_CONNECTION_ABORTED]:
+                logger.exception("%s: _handle_channel() -- Channel %d failed.", cls.__name__, channel.id)
+            else:
+                logger.info("%s: _handle_channel() -- Channel %d: %s.", cls.__name__, channel.id, e)
+        except Exception:
+            logger.exception("%s: _handle_channel() -- Channel %d failed.", cls.__name__, channel.id)
+        finally:
+            channel.close()
+
+
+#
+# Define a channel of a multiplexer. The received data is stored in a
+# buffer protocol, that is fed by the reader thread of the multiplexer;
+# the channel waits for its pipe. Sent data is queued, and sent by the
+# writer thread of the multiplexer.
+#
+class _Channel(Connection):
+    def __init__(self, multiplexer, channel_id, window):
+        super(_Channel, self).__init__()
+        self._multiplexer = multiplexer
+        self._id = channel_id
+        self._protocol = _BufferProtocol()
+        self._poller = select.poll()
+        self._poller.register(self._protocol, select.POLLIN)
+        #
+        # The state below is guarded by the condition of the multiplexer.
+        #
+        self._pending = deque()                                                # Memoryviews of the data to send.
+        self._pending_size = 0
+        self._scheduled = False
+        self._credit = window                                                  # Number of bytes the peer accepts.
+        self._receive_window = window                                          # Number of bytes the peer may send.
+        self._consumed = 0                                                     # Number of consumed bytes not granted yet.
+        self._local_closed = False
+        self._remote_closed = False
+        self._close_sent = False
+
+    def __del__(self):
+        self._protocol.close()
+
+    #
+    # Return the channel id.
+    #
+    @property
+    def id(self):
+        return self._id
+
+    #
+    # Close the channel. The data that is queued is still sent.
+    #
+    def close(self):
+        self._multiplexer._close_channel(self)
+
+    #
+    # Send buffer to peer. Return when the buffer is queued for sending;
+    # wait while the queue of the channel is full. When timeout is not
+    # None, raise a timeout error when the buffer could not be queued
+    # within timeout seconds.
+    #
+    def send(self, buffer, encoding='utf8', timeout=None):
+        buffer = self._encode(buffer, encoding)
+        if not isinstance(buffer, bytes):
+            buffer = bytes(buffer)                                             # The caller may modify the buffer after send() returns.
+        self._multiplexer._send(self, memoryview(buffer), timeout)
+
+    #
+    # Wait until there is received data. Raise an exception when the
+    # channel is closed, or when no data is received within timeout
+    # seconds. When timeout is None, wait forever.
+    #
+    def _wait_readable(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._protocol.readable():
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0.0:
+                    raise ConnectionError(E_CONNECTION_TIMEOUT, _error2string[E_CONNECTION_TIMEOUT])
+            self._poller.poll(None if wait is None else wait * 1000.0)
+        if len(self._protocol) == 0:
+            raise self._multiplexer._channel_error(self)
+
+    #
+    # Receive data from peer. Data that was already received
+    # by the line reader is returned first.
+    #
+    def receive(self, buffer_size=1024, encoding='utf8', timeout=None):
+        buffer_size = max(1, buffer_size)                                      # Buffer size is at least 1 byte.
+        buffer = self._receive_line_buffer(buffer_size, encoding)
+        if buffer is not None:
+            return buffer                                                      # Read ahead by the line reader.
+        self._wait_readable(timeout)
+        buffer = self._protocol.read(buffer_size)
+        self._multiplexer._consumed(self, len(buffer))
+        return self._decode(buffer, encoding)
+
+    #
+    # Receive data from peer into view, without
+    # allocating an intermediate buffer.
+    #
+    def _receive_into(self, view, timeout=None):
+        self._wait_readable(timeout)
+        size = self._protocol.readinto(view)
+        self._multiplexer._consumed(self, size)
+        return size
+
+    #
+    # Return a tuple indicating whether or not the
+    # connection is ready for reading and/or writing.
+    #
+    def poll(self):
+        return len(self._protocol) != 0 or len(self._line_buffer) != 0, self._multiplexer._writable(self)
+
+    #
+    # Return True when the channel is closed, or
+    # the multiplexer is stopped.
+    #
+    @property
+    def disconnect(self):
+        return self._local_closed or self._multiplexer._error is not None
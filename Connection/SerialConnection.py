@@ -1,8 +1,13 @@
+import os
 import errno
-from threading import Lock
+import time
+import select
+from collections import deque
+from threading import Condition
 from serial.threaded import Protocol, ReaderThread
 from serial import SerialException
 from .Connection import Connection, ConnectionError
+from .DisconnectEvent import DisconnectEvent
 from .Errors import *
 from .Errors import _error2string
 
@@ -11,38 +16,203 @@ from .Errors import _error2string
 # Define a protocol that simply stores the
 # received data in a buffer.
 #
+# The buffer is a deque of the received chunks; the first chunk may be
+# partially consumed. Appending a chunk and consuming data are O(1) per
+# chunk, so the cost of a read does not depend on the amount of data
+# that is buffered. The received chunks are never copied while the
+# lock is held.
+#
+# The buffer is bounded by a high watermark. When it is reached, the
+# reader thread stops reading the serial port, and asserts the flow
+# control of the port (XOFF or RTS), until no more than low watermark
+# bytes are left in the buffer. The buffer may exceed the high watermark
+# by the data of a single read, which the serial driver bounds.
+#
+# The protocol holds a pipe that is readable while the buffer holds
+# data, or the connection is lost. The consuming thread waits for the
+# pipe (together with a disconnect event) in a single poll() call, and
+# sleeps until data arrives. The pipe is only written when the buffer
+# becomes non-empty, not for each received chunk.
+#
+# Instead of a reader thread, a selector loop that reads the serial
+# port itself may feed() the protocol. Feeding never blocks; the loop
+# pauses reading the port itself when the buffer is full, and the
+# drained callback tells it when to resume.
+#
 class _BufferProtocol(Protocol):
-    def __init__(self):
+    def __init__(self, serial_=None):
         super(_BufferProtocol, self).__init__()
-        self._lock = Lock()
-        self._buffer = bytearray()
+        self._condition = Condition()
+        self._chunks = deque()
+        self._offset = 0                                                       # Number of consumed bytes of the first chunk.
+        self._size = 0                                                         # Number of buffered bytes.
         self._transport = None
+        self._serial = serial_
         self._connection_reset = False
+        self._high_watermark = Connection._high_watermark
+        self._low_watermark = Connection._high_watermark // 2
+        self._stopped = False
+        self._paused = False                                                   # The buffer reached the high watermark.
+        self._on_drained = None                                                # Called when a paused buffer drained.
+        self._lost = False
+        self._signalled = False                                                # A byte is pending in the pipe.
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
 
     #
     # Return the length of the receive buffer.
     #
     def __len__(self):
-        return len(self._buffer)
+        return self._size
+
+    #
+    # Return the file descriptor that is readable while there
+    # is received data, or when the connection is lost.
+    #
+    def fileno(self):
+        return self._read_fd
+
+    #
+    # Make the pipe readable. Must be called with the condition held.
+    #
+    def _signal(self):
+        if not self._signalled:
+            self._signalled = True
+            try:
+                os.write(self._write_fd, b'\0')
+            except OSError:
+                pass                                                           # The pipe is closed.
+
+    #
+    # Return True when there is received data, or the connection is
+    # lost. Otherwise empty the pipe, so it becomes readable when
+    # data arrives, and return False.
+    #
+    def readable(self):
+        with self._condition:
+            if self._size != 0 or self._lost:
+                return True
+            if self._signalled:
+                self._signalled = False
+                try:
+                    os.read(self._read_fd, 4096)
+                except OSError:
+                    pass                                                       # Nothing to read, or the pipe is closed.
+            return False
+
+    #
+    # Close the pipe.
+    #
+    def close(self):
+        for fd in (self._read_fd, self._write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
 
     #
     # Called when a connection is made.
     #
     def connection_made(self, transport):
         self._transport = transport
+        self._serial = transport.serial
+
+    #
+    # Set the high and low watermark of the receive buffer.
+    #
+    def set_watermarks(self, high_watermark, low_watermark):
+        with self._condition:
+            self._high_watermark, self._low_watermark = high_watermark, low_watermark
+            self._condition.notify_all()
+
+    #
+    # Enable or disable the input flow control of the serial port;
+    # XON/XOFF when software flow control is enabled, RTS when
+    # hardware flow control is enabled. Without flow control, the
+    # data the peer sends while reading is paused may be lost.
+    #
+    def _flow_control(self, enable):
+        serial_ = self._serial
+        try:
+            if serial_.xonxoff:
+                serial_.set_input_flow_control(enable)
+            if serial_.rtscts:
+                serial_.rts = enable
+        except (SerialException, OSError):
+            pass                                                               # The port is closed; nothing to control.
 
     #
     # Called by the transport layer (thread) when bits of data
-    # are received. Accumulate them in the receive buffer.
+    # are received. Accumulate them in the receive buffer. Block
+    # the reader thread while the buffer is full.
     #
     def data_received(self, data):
-        with self._lock:
-            self._buffer.extend(data)
+        with self._condition:
+            self._append(data)
+            if self._size < self._high_watermark:
+                return
+            self._flow_control(False)
+            while self._size > self._low_watermark and not self._stopped:
+                self._condition.wait()
+            self._flow_control(True)
+
+    #
+    # Append data to the receive buffer and make the pipe readable.
+    # Must be called with the condition held.
+    #
+    def _append(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        self._signal()
+
+    #
+    # Append data to the receive buffer without blocking. Return True
+    # when the buffer is full; the caller must stop reading the serial
+    # port until the drained callback is called.
+    #
+    def feed(self, data):
+        with self._condition:
+            self._append(data)
+            self._paused = self._size >= self._high_watermark
+            return self._paused
+
+    #
+    # Set the callable that is called (with the condition held)
+    # when a full buffer drained to the low watermark.
+    #
+    def set_drained_callback(self, on_drained):
+        self._on_drained = on_drained
+
+    #
+    # Wake up the reader thread when it is blocked on a full
+    # receive buffer, so it can be stopped.
+    #
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    #
+    # Wake up the reader thread when the receive buffer
+    # has drained to the low watermark. Must be called with
+    # the condition held.
+    #
+    def _drained(self):
+        if self._size <= self._low_watermark:
+            self._condition.notify_all()
+            if self._paused:
+                self._paused = False
+                if self._on_drained is not None:
+                    self._on_drained()
 
     #
     # Called when the connection is lost from reader thread.
     #
     def connection_lost(self, exception):
+        with self._condition:
+            self._lost = True
+            self._signal()
         if exception is not None:
             if isinstance(exception, SerialException):
                 self._connection_reset = True
@@ -58,24 +228,46 @@ class _BufferProtocol(Protocol):
     def connection_reset(self):
         return self._connection_reset
 
+    #
+    # Remove at most size bytes from the received buffer, and
+    # return them as a list of bytes objects and memoryviews. A
+    # chunk that is consumed entirely is returned as is.
+    #
+    def _consume(self, size):
+        pieces = []
+        with self._condition:
+            while size > 0 and len(self._chunks) != 0:
+                chunk = self._chunks[0]
+                end = min(len(chunk), self._offset + size)
+                pieces.append(chunk if self._offset == 0 and end == len(chunk) else memoryview(chunk)[self._offset:end])
+                size -= end - self._offset
+                self._size -= end - self._offset
+                if end == len(chunk):
+                    self._chunks.popleft()
+                    self._offset = 0
+                else:
+                    self._offset = end
+            self._drained()
+        return pieces
+
     #
     # Return max buffer size bytes from the
     # received buffer.
     #
     def read(self, buffer_size):
-        with self._lock:
-            buffer, self._buffer = self._buffer[:buffer_size], self._buffer[buffer_size:]
-        return bytes(buffer)
+        return b''.join(self._consume(buffer_size))                           # A single chunk is returned without copying.
 
     #
-    # Use the transport layer to send the data.
+    # Move at most len(view) bytes from the received buffer
+    # into the writable memoryview view. Return the number
+    # of bytes moved.
     #
-    def write(self, data):
-        try:
-            self._transport.write(data)                                # This function does not return the number of bytes send.
-        except SerialException:
-            raise ConnectionError(E_CONNECTION_RESET, _error2string[E_CONNECTION_RESET])
-        return len(data)                                               # Assume all data has been written.
+    def readinto(self, view):
+        size = 0
+        for piece in self._consume(len(view)):
+            view[size:size + len(piece)] = piece
+            size += len(piece)
+        return size
 
 
 #
@@ -94,57 +286,162 @@ class _ExceptionReaderThread(ReaderThread):
 # Define a serial connection. Reading the serial port
 # is done in a separate thread by using ReaderThread()
 #
+# When the disconnect callable is a DisconnectEvent, the connection waits
+# for received data and the event together and wakes up as soon as either
+# one fires. Any other disconnect callable is checked every _poll_interval
+# seconds while waiting.
+#
+# Data is sent by non-blocking writes to the serial port. The output
+# queue of the serial driver is drained at the pace of the line, and
+# the driver stops draining it when the peer asserts flow control (CTS
+# or XOFF). When the queue is full, send() waits until the driver
+# reports the port writable, so the handler is slowed down to the
+# pace of the line as well.
+#
 class _SerialConnection(Connection):
+    _poll_interval = 0.1
+
     def __init__(self, serial_, disconnect):
         super(_SerialConnection, self).__init__()
         self._disconnect = disconnect
-        self._transport = _ExceptionReaderThread(serial_, _BufferProtocol)
-        self._transport.start()
-        self._transport, self._protocol = self._transport.connect()
+        self._serial = serial_
+        self._transport, self._protocol = self._connect()
+        self._poller = select.poll()
+        self._poller.register(self._protocol, select.POLLIN)
+        self._write_poller = select.poll()
+        self._write_poller.register(self._serial.fileno(), select.POLLOUT)
+        if isinstance(self._disconnect, DisconnectEvent):
+            self._poller.register(self._disconnect, select.POLLIN)
+            self._write_poller.register(self._disconnect, select.POLLIN)
 
     #
     # Stop the transport thread when the object is deleted.
     #
     def __del__(self):
+        self._stop_transport()
+        self._protocol.close()
+
+    #
+    # Start the transport thread that reads the serial port, and
+    # return the (transport, protocol) tuple.
+    #
+    def _connect(self):
+        transport = _ExceptionReaderThread(self._serial, _BufferProtocol)
+        transport.start()
+        return transport.connect()
+
+    #
+    # Stop the transport thread, also when it is
+    # blocked on a full receive buffer.
+    #
+    def _stop_transport(self):
+        self._protocol.stop()
         self._transport.stop()
 
     #
-    # Send buffer to peer.
+    # Set the buffer limits of the connection, and the
+    # watermarks of the protocol receive buffer.
     #
-    def send(self, buffer, encoding='utf8'):
+    def set_buffer_limits(self, high_watermark, low_watermark=None):
+        super(_SerialConnection, self).set_buffer_limits(high_watermark, low_watermark)
+        self._protocol.set_watermarks(self._high_watermark, self._low_watermark)
+
+    #
+    # Wait until the serial port is ready for writing. Raise an
+    # exception when a disconnect is requested, or when the deadline
+    # passes. When deadline is None, wait forever.
+    #
+    def _wait_writable(self, deadline):
+        event = isinstance(self._disconnect, DisconnectEvent)
+        while True:
+            if self.disconnect:
+                raise ConnectionError(E_CONNECTION_ABORTED, _error2string[E_CONNECTION_ABORTED])
+            wait = None if event else self._poll_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    raise ConnectionError(E_CONNECTION_TIMEOUT, _error2string[E_CONNECTION_TIMEOUT])
+                wait = remaining if wait is None else min(wait, remaining)
+            ready = dict(self._write_poller.poll(None if wait is None else wait * 1000.0))
+            if ready.get(self._serial.fileno(), 0) & (select.POLLOUT | select.POLLERR | select.POLLHUP):
+                return                                                         # Port ready (or in error, which the next write reports).
+
+    #
+    # Send buffer to peer. The buffer is encoded once and written in
+    # as few writes as the output queue of the serial driver allows.
+    # When timeout is None, the write timeout of the serial port is
+    # used. Raise a timeout error when the buffer could not be sent
+    # within timeout seconds.
+    #
+    def send(self, buffer, encoding='utf8', timeout=None):
+        timeout = self._serial.write_timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        buffer = memoryview(self._encode(buffer, encoding)).cast('B')
         total = 0
         while total < len(buffer):
-            while True:
-                if self.disconnect:
-                    raise ConnectionError(E_CONNECTION_ABORTED, _error2string[E_CONNECTION_ABORTED])
-                read, write = self.poll()
-                if write:
-                    break                                                      # Serial connection ready for writing.
-            sent = self._protocol.write(self._encode(buffer[total:], encoding))
-            total += sent
+            try:
+                total += os.write(self._serial.fileno(), buffer[total:])
+                continue
+            except (BlockingIOError, InterruptedError):
+                pass                                                           # The output queue is full.
+            except OSError:
+                raise ConnectionError(E_CONNECTION_RESET, _error2string[E_CONNECTION_RESET])
+            self._wait_writable(deadline)
 
     #
-    # Receive data from peer.
+    # Wait until there is received data. Raise an exception when a
+    # disconnect is requested, or when no data is received within
+    # timeout seconds. When timeout is None, wait forever.
     #
-    def receive(self, buffer_size=1024, encoding='utf8'):
+    def _wait_readable(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        event = isinstance(self._disconnect, DisconnectEvent)
         while True:
             if self.disconnect:
                 raise ConnectionError(E_CONNECTION_ABORTED, _error2string[E_CONNECTION_ABORTED])
-            read, write = self.poll()
-            if read:
+            if self._protocol.readable():
+                if len(self._protocol) == 0:
+                    raise ConnectionError(E_CONNECTION_RESET, _error2string[E_CONNECTION_RESET])
                 break                                                          # Serial connection ready for reading.
+            wait = None if event else self._poll_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    raise ConnectionError(E_CONNECTION_TIMEOUT, _error2string[E_CONNECTION_TIMEOUT])
+                wait = remaining if wait is None else min(wait, remaining)
+            self._poller.poll(None if wait is None else wait * 1000.0)
+
+    #
+    # Receive data from peer. Data that was already received
+    # by the line reader is returned first.
+    #
+    def receive(self, buffer_size=1024, encoding='utf8', timeout=None):
         buffer_size = max(1, buffer_size)                                      # Buffer size is at least 1 byte.
+        buffer = self._receive_line_buffer(buffer_size, encoding)
+        if buffer is not None:
+            return buffer                                                      # Read ahead by the line reader.
+        self._wait_readable(timeout)
         return self._decode(self._protocol.read(buffer_size), encoding)
 
+    #
+    # Receive data from peer into view, without
+    # allocating an intermediate buffer.
+    #
+    def _receive_into(self, view, timeout=None):
+        self._wait_readable(timeout)
+        return self._protocol.readinto(view)
+
     #
     # Return a tuple indicating whether or not the
     # connection is ready for reading and/or writing.
     #
     # Data can be read when there is data in the protocol receive buffer.
-    # A serial connection is always ready for writing (Right?).
+    # Data can be written when the output queue of the serial driver is
+    # not full.
     #
     def poll(self):
-        return len(self._protocol) != 0, True
+        events = dict(self._write_poller.poll(0)).get(self._serial.fileno(), 0)
+        return len(self._protocol) != 0, events & select.POLLOUT != 0
 
     #
     # Return True when a disconnect is requested and
@@ -159,7 +456,142 @@ class _SerialConnection(Connection):
         disconnect = self._disconnect()
         connection_reset = self._protocol.connection_reset()
         if disconnect or connection_reset:
-            self._transport.stop()
+            self._stop_transport()
         if connection_reset:
             raise ConnectionError(E_CONNECTION_RESET, _error2string[E_CONNECTION_RESET])
         return disconnect
+
+
+#
+# Define a multiplexed serial connection. The serial port is not read
+# by a transport thread, but by the selector loop of a multi-port
+# serial server, that feeds the received data into the protocol. The
+# connection never waits for received data: like an evented connection,
+# receive() returns an empty string (or bytes object), receive_line()
+# returns None when no complete line has been received, etc. Sending
+# data blocks while the output queue of the serial driver is full.
+#
+class _MultiplexedSerialConnection(_SerialConnection):
+    _blocking = False
+
+    #
+    # Create the protocol the selector loop feeds;
+    # there is no transport thread.
+    #
+    def _connect(self):
+        return None, _BufferProtocol(self._serial)
+
+    #
+    # Wake up a reader that waits for data.
+    #
+    def _stop_transport(self):
+        self._protocol.stop()
+
+    #
+    # Called by the selector loop with the data it read from the
+    # serial port. Return True when the receive buffer is full; the
+    # flow control of the port is asserted, and the loop must stop
+    # reading the port until _resume() returns True.
+    #
+    def _feed(self, data):
+        if self._protocol.feed(data):
+            self._protocol._flow_control(False)
+            return True
+        return False
+
+    #
+    # Release the flow control of the port, and return True, when
+    # the full receive buffer drained to the low watermark.
+    #
+    def _resume(self):
+        if self._protocol._paused:
+            return False
+        self._protocol._flow_control(True)
+        return True
+
+    #
+    # Set the callable that is called when the full receive
+    # buffer drained to the low watermark.
+    #
+    def _set_drained_callback(self, on_drained):
+        self._protocol.set_drained_callback(on_drained)
+
+    #
+    # Called by the selector loop when the handler returned. When the
+    # handler left a full receive buffer, it does not consume the data;
+    # discard all received data and return True.
+    #
+    def _discard_overflow(self):
+        if not self._protocol._paused and len(self._line_buffer) < self._high_watermark:
+            return False
+        del self._line_buffer[:]
+        self._line_scan = 0
+        self._protocol.read(len(self._protocol))
+        return True
+
+    #
+    # Called by the selector loop when the serial port is lost.
+    #
+    def _connection_lost(self, exception):
+        self._protocol.connection_lost(exception)
+
+    #
+    # Move all received data into the line buffer, but never more
+    # than the high watermark allows. Return False when there was no
+    # data to move.
+    #
+    def _fill_line_buffer(self, timeout=None):
+        if self.disconnect:
+            raise ConnectionError(E_CONNECTION_ABORTED, _error2string[E_CONNECTION_ABORTED])
+        self._check_buffer_overflow()
+        moved = False
+        while len(self._protocol) != 0 and len(self._line_buffer) < self._high_watermark:
+            self._line_buffer += self._protocol.read(self._high_watermark - len(self._line_buffer))
+            moved = True
+        return moved
+
+    #
+    # Move the received data into view without waiting. Return
+    # the number of bytes moved; 0 when no data is available.
+    #
+    def _receive_into(self, view, timeout=None):
+        if self.disconnect:
+            raise ConnectionError(E_CONNECTION_ABORTED, _error2string[E_CONNECTION_ABORTED])
+        return self._protocol.readinto(view)
+
+    #
+    # Return at most buffer size bytes of the received data. When
+    # no data is available an empty string (or bytes object) is
+    # returned.
+    #
+    def receive(self, buffer_size=1024, encoding='utf8', timeout=None):
+        buffer = bytearray(max(1, buffer_size))                                # Buffer size is at least 1 byte.
+        size = self.receive_into(buffer)
+        del buffer[size:]
+        return self._decode(buffer, encoding)
+
+    #
+    # Return a memoryview of exactly size received bytes, or None
+    # when fewer bytes have been received so far.
+    #
+    def receive_exactly(self, size, buffer=None, timeout=None):
+        if len(self._line_buffer) + len(self._protocol) < size:
+            return None
+        return super(_MultiplexedSerialConnection, self).receive_exactly(size, buffer, timeout)
+
+    #
+    # Return the next message, or None when the complete message
+    # has not been received yet. The received data is moved into
+    # the line buffer first, where the message is looked for.
+    #
+    def receive_message(self, max_size=None, timeout=None):
+        self._fill_line_buffer()
+        return super(_MultiplexedSerialConnection, self).receive_message(max_size, timeout)
+
+    #
+    # Return a tuple indicating whether or not the connection has
+    # received data and whether the serial port is ready for writing.
+    #
+    def poll(self):
+        read, write = super(_MultiplexedSerialConnection, self).poll()
+        return read or len(self._line_buffer) != 0, write
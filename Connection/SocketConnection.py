@@ -2,7 +2,9 @@ import os
 import socket
 import select
 import errno
-from .Connection import Connection
+import time
+from .Connection import Connection, ConnectionError
+from .DisconnectEvent import DisconnectEvent
 from .Errors import *
 from .Errors import _error2string
 
@@ -10,7 +12,16 @@ from .Errors import _error2string
 #
 # Define a socket connection.
 #
+# Waiting for the socket to become ready is done in the kernel. When the
+# disconnect callable is a DisconnectEvent, the connection waits for the
+# socket and the event together and wakes up as soon as either one fires.
+# Any other disconnect callable is checked every _poll_interval seconds
+# while waiting.
+#
 class _SocketConnection(Connection):
+    _poll_interval = 0.1
+    _iov_max = os.sysconf('SC_IOV_MAX') if 'SC_IOV_MAX' in os.sysconf_names else 1024
+
     def __init__(self, socket_, address, disconnect):
         super(_SocketConnection, self).__init__()
         if not callable(disconnect):
@@ -18,42 +29,125 @@ class _SocketConnection(Connection):
         self._socket = socket_
         self._address = address
         self._disconnect = disconnect
+        self._pollers = {}                                                     # One poller per direction, so a reader and a writer thread can wait concurrently.
 
     #
-    # Send buffer to peer.
+    # Return the poller that waits until the socket is ready for reading,
+    # or for writing when write is True. The pollers are created when
+    # first used, so connections that never wait do not create them.
     #
-    def send(self, buffer, encoding='utf8'):
-        while True:
-            if self.disconnect:
-                raise socket.error(errno.ECONNABORTED, os.strerror(errno.ECONNABORTED))
-            read, write = self.poll()
-            if write:
-                break                                                          # Socket ready for writing.
-        self._socket.sendall(self._encode(buffer, encoding))
+    def _poller(self, write):
+        poller = self._pollers.get(write)
+        if poller is None:
+            poller = select.poll()
+            poller.register(self._socket, select.POLLOUT if write else select.POLLIN)
+            if isinstance(self._disconnect, DisconnectEvent):
+                poller.register(self._disconnect, select.POLLIN)
+            self._pollers[write] = poller
+        return poller
 
     #
-    # Receive data from peer.
+    # Wait until the socket is ready for reading, or for writing when
+    # write is True. Raise a connection aborted error when a disconnect
+    # is requested, and a timeout error when the socket does not become
+    # ready within timeout seconds. When timeout is None, wait forever.
     #
-    def receive(self, buffer_size=1024, encoding='utf8'):
+    def _wait(self, write=False, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        event = isinstance(self._disconnect, DisconnectEvent)
+        poller = self._poller(write)
         while True:
-            if self.disconnect:
+            if not event and self.disconnect:
                 raise socket.error(errno.ECONNABORTED, os.strerror(errno.ECONNABORTED))
-            read, write = self.poll()
-            if read:
-                break                                                          # Socket ready for reading.
+            wait = None if event else self._poll_interval
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                wait = remaining if wait is None else min(wait, remaining)
+            ready = dict(poller.poll(None if wait is None else wait * 1000.0))
+            if event and self._disconnect.fileno() in ready:
+                raise socket.error(errno.ECONNABORTED, os.strerror(errno.ECONNABORTED))
+            if self._socket.fileno() in ready:
+                return                                                         # Socket ready (or in error, which the next call reports).
+            if deadline is not None and time.monotonic() >= deadline:
+                raise socket.timeout(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT))
+
+    #
+    # Send buffer to peer. When timeout is not None, raise a timeout
+    # error when the buffer could not be sent within timeout seconds.
+    #
+    def send(self, buffer, encoding='utf8', timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        buffer = memoryview(self._encode(buffer, encoding))
+        total = 0
+        while total < len(buffer):
+            self._wait(True, None if deadline is None else deadline - time.monotonic())
+            try:
+                total += self._socket.send(buffer[total:], socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                continue
+
+    #
+    # Send all buffers to peer with scatter-gather sendmsg() calls,
+    # so the buffers are neither joined nor sent one by one. At most
+    # _iov_max buffers are passed per call. When timeout is not None,
+    # raise a timeout error when the buffers could not be sent within
+    # timeout seconds.
+    #
+    def send_many(self, buffers, encoding='utf8', timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        views = [memoryview(self._encode(buffer, encoding)).cast('B') for buffer in buffers]
+        views = [view for view in views if len(view) != 0]
+        index = 0
+        while index < len(views):
+            self._wait(True, None if deadline is None else deadline - time.monotonic())
+            try:
+                sent = self._socket.sendmsg(views[index:index + self._iov_max], (), socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                continue
+            while sent > 0:
+                if sent >= len(views[index]):
+                    sent -= len(views[index])
+                    index += 1
+                else:
+                    views[index] = views[index][sent:]                         # Partially sent; continue with the remainder.
+                    sent = 0
+
+    #
+    # Receive data from peer. Data that was already received by the
+    # line reader is returned first. When timeout is not None, raise a
+    # timeout error when no data is received within timeout seconds.
+    #
+    def receive(self, buffer_size=1024, encoding='utf8', timeout=None):
         buffer_size = max(1, buffer_size)                                      # Buffer size is at least 1 byte.
+        buffer = self._receive_line_buffer(buffer_size, encoding)
+        if buffer is not None:
+            return buffer                                                      # Read ahead by the line reader.
+        self._wait(False, timeout)
         buffer = self._socket.recv(buffer_size)
         if len(buffer) == 0:
             raise socket.error(errno.ECONNRESET, os.strerror(errno.ECONNRESET))
         return self._decode(buffer, encoding)
 
+    #
+    # Receive data from peer into view, without
+    # allocating an intermediate buffer.
+    #
+    def _receive_into(self, view, timeout=None):
+        self._wait(False, timeout)
+        size = self._socket.recv_into(view)
+        if size == 0:
+            raise socket.error(errno.ECONNRESET, os.strerror(errno.ECONNRESET))
+        return size
+
     #
     # Return a tuple indicating whether or not the
     # connection is ready for reading and/or writing.
     #
     def poll(self):
-        read, write, error = select.select([self._socket], [self._socket], [], 0.0)
-        return len(read) != 0, len(write) != 0
+        poller = select.poll()
+        poller.register(self._socket, select.POLLIN | select.POLLOUT)
+        events = dict(poller.poll(0)).get(self._socket.fileno(), 0)
+        return events & (select.POLLIN | select.POLLHUP | select.POLLERR) != 0, events & select.POLLOUT != 0
 
     #
     # Return True when a disconnect is requested.
@@ -61,3 +155,151 @@ class _SocketConnection(Connection):
     @property
     def disconnect(self):
         return self._disconnect()
+
+
+#
+# Define an evented socket connection. The socket is non-blocking
+# and is driven by the selector loop of an evented server. Received
+# data is accumulated in the line buffer by the server loop, data to
+# send is queued in an output buffer and is flushed by the server
+# loop whenever the socket is ready for writing. None of the methods
+# block. The output buffer holds at most high watermark bytes; sending
+# more raises a send buffer overflow error, and nothing is queued.
+#
+class _EventedSocketConnection(_SocketConnection):
+    _blocking = False
+
+    def __init__(self, socket_, address, disconnect):
+        super(_EventedSocketConnection, self).__init__(socket_, address, disconnect)
+        self._socket.setblocking(False)
+        self._output_buffer = bytearray()
+
+    #
+    # Called by the server loop when the socket is ready for reading.
+    # Read until the socket would block, so no data is left behind
+    # in the kernel (the readiness notification may be edge-triggered).
+    # At most max_size bytes are read per call, so a single busy peer
+    # cannot starve the other connections. Reading stops when the line
+    # buffer reaches the high watermark; the remaining data is left in
+    # the kernel, so the peer is slowed down by TCP flow control. The
+    # data is received into chunk, a memoryview that the server loop
+    # shares between all its connections. Return False when the peer
+    # closed the connection.
+    #
+    def _read_ready(self, chunk, max_size=262144):
+        total = 0
+        while total < max_size:
+            room = self._high_watermark - len(self._line_buffer)
+            if room <= 0:
+                break                                                          # Buffer full; pause reading.
+            try:
+                size = self._socket.recv_into(chunk[:room] if room < len(chunk) else chunk)
+            except (BlockingIOError, InterruptedError):
+                break
+            if size == 0:
+                return False
+            self._line_buffer += chunk[:size]
+            total += size
+        return True
+
+    #
+    # Called by the server loop when the socket is ready for writing.
+    # Send as much of the output buffer as the socket accepts. Return
+    # True when the output buffer is empty.
+    #
+    def _write_ready(self):
+        while len(self._output_buffer) != 0:
+            try:
+                sent = self._socket.send(self._output_buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            del self._output_buffer[:sent]
+        return len(self._output_buffer) == 0
+
+    #
+    # Return True when there is data waiting to be sent.
+    #
+    @property
+    def _write_pending(self):
+        return len(self._output_buffer) != 0
+
+    #
+    # Raise a send buffer overflow error when size more bytes do not fit
+    # in the output buffer, after sending what the socket accepts now.
+    #
+    def _check_output_room(self, size):
+        if len(self._output_buffer) + size > self._high_watermark:
+            self._write_ready()
+            if len(self._output_buffer) + size > self._high_watermark:
+                raise ConnectionError(E_SEND_BUFFER_OVERFLOW, _error2string[E_SEND_BUFFER_OVERFLOW] % self._high_watermark)
+
+    #
+    # Queue buffer for sending and try to send it right away.
+    # Whatever cannot be sent now is sent by the server loop.
+    #
+    def send(self, buffer, encoding='utf8', timeout=None):
+        if self.disconnect:
+            raise socket.error(errno.ECONNABORTED, os.strerror(errno.ECONNABORTED))
+        buffer = self._encode(buffer, encoding)
+        self._check_output_room(buffer.nbytes if isinstance(buffer, memoryview) else len(buffer))
+        self._output_buffer.extend(buffer)
+        self._write_ready()
+
+    #
+    # Queue all buffers for sending and try to send them right away.
+    #
+    def send_many(self, buffers, encoding='utf8', timeout=None):
+        if self.disconnect:
+            raise socket.error(errno.ECONNABORTED, os.strerror(errno.ECONNABORTED))
+        buffers = [self._encode(buffer, encoding) for buffer in buffers]
+        self._check_output_room(sum(buffer.nbytes if isinstance(buffer, memoryview) else len(buffer) for buffer in buffers))
+        for buffer in buffers:
+            self._output_buffer += buffer
+        self._write_ready()
+
+    #
+    # Return at most buffer size bytes of the received data. When
+    # no data is available an empty string (or bytes object) is
+    # returned.
+    #
+    def receive(self, buffer_size=1024, encoding='utf8', timeout=None):
+        if self.disconnect:
+            raise socket.error(errno.ECONNABORTED, os.strerror(errno.ECONNABORTED))
+        buffer_size = max(1, buffer_size)                                      # Buffer size is at least 1 byte.
+        buffer = self._line_buffer[:buffer_size]
+        del self._line_buffer[:buffer_size]
+        self._line_scan = 0
+        return self._decode(buffer, encoding)
+
+    #
+    # Return a tuple indicating whether or not the connection
+    # has received data and whether all queued data has been sent.
+    #
+    def poll(self):
+        return len(self._line_buffer) != 0, len(self._output_buffer) == 0
+
+    #
+    # Data is only received by the server loop; receive_line()
+    # returns None when no complete line is buffered, and raises
+    # a buffer overflow error when the line buffer is full.
+    #
+    def _fill_line_buffer(self, timeout=None):
+        self._check_buffer_overflow()
+        return False
+
+    #
+    # All received data is in the line buffer, which receive_into()
+    # empties first; nothing more can be received without blocking.
+    #
+    def _receive_into(self, view, timeout=None):
+        return 0
+
+    #
+    # Return a memoryview of exactly size received bytes, or None
+    # when fewer bytes have been received so far. The bytes are
+    # left in place until enough have been received.
+    #
+    def receive_exactly(self, size, buffer=None, timeout=None):
+        if len(self._line_buffer) < size:
+            return None
+        return super(_EventedSocketConnection, self).receive_exactly(size, buffer, timeout)
@@ -0,0 +1,219 @@
+import os
+import tty
+import math
+import time
+import random
+import select
+import threading
+from collections import deque
+
+
+#
+# Define one direction of a virtual serial pair: the data written to the
+# source port is read from the master of its pseudo-terminal, and written
+# to the master of the destination port.
+#
+class _VirtualSerialLink(object):
+    def __init__(self, source, destination):
+        self.source = source
+        self.destination = destination
+        self.line_free = 0.0                                                   # Time at which the simulated line is idle.
+        self.queue = deque()                                                   # (delivery time, data) tuples in flight.
+        self.queued = 0                                                        # Number of bytes in flight.
+        self.next_error = None                                                 # Number of bits until the next bit error.
+        self.blocked = False                                                   # The destination does not accept more data.
+
+
+#
+# Define a virtual serial pair: two serial ports connected by a null
+# modem cable, for load testing and profiling the serial servers, clients
+# and connections without serial devices (Linux and other platforms with
+# pseudo-terminals only).
+#
+# Each port is the slave of a pseudo-terminal (e.g. '/dev/pts/3'), so
+# its name can be used wherever a port name is accepted. When links is
+# a tuple of two path names, symbolic links with these names are created
+# to the ports, so the ports have fixed names (e.g. for a server and a
+# client in different processes, or for a glob pattern of a multi-port
+# server). The ports are removed when the pair is closed, as if the
+# cable was unplugged.
+#
+# A bridge thread copies the data between the masters of the two
+# pseudo-terminals. It optionally simulates:
+#
+# * baudrate: the speed of the line. Each byte takes _bits_per_char bits;
+#             the data is transmitted in slices of _slice seconds. The
+#             sender is slowed down to the speed of the line, as the
+#             output queue of its port fills up. None for no limit.
+# * latency: the number of seconds between the transmission and the
+#            arrival of the data.
+# * bit_error_rate: the probability that a transmitted bit is flipped.
+#                   Seed seeds the random errors, for reproducible runs.
+#
+# Software flow control (XON/XOFF) is passed through and handled by the
+# ports. Modem control lines (RTS/CTS, DSR/DTR) are not supported by
+# pseudo-terminals.
+#
+class VirtualSerialPair(object):
+    _bits_per_char = 10                                                        # Start bit, 8 data bits and stop bit.
+    _slice = 0.005
+    _chunk_size = 4096
+    _queue_limit = 65536                                                       # Maximum number of bytes in flight per direction.
+
+    def __init__(self, links=None, baudrate=None, latency=0.0, bit_error_rate=0.0, seed=None):
+        self._baudrate = baudrate
+        self._latency = latency
+        self._bit_error_rate = bit_error_rate
+        self._random = random.Random(seed)
+        self._masters = []
+        self._slaves = []
+        self._links = []
+        self._read_fd, self._write_fd = os.pipe()                              # Wakes up the bridge thread when the pair is closed.
+        for index in range(2):
+            master, slave = os.openpty()
+            tty.setraw(slave)                                                  # No echo, until a port is opened and configured.
+            os.set_blocking(master, False)
+            self._masters.append(master)
+            self._slaves.append(slave)                                         # Held open, so a port can be closed and opened again.
+        self.ports = tuple(os.ttyname(slave) for slave in self._slaves)
+        if links is not None:
+            for link, port in zip(links, self.ports):
+                os.symlink(port, link)
+                self._links.append(link)
+            self.ports = tuple(links)
+        self._thread = threading.Thread(target=self._bridge, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    #
+    # Return the number of bits until the next bit
+    # error: a geometrically distributed random number.
+    #
+    def _bit_error_interval(self):
+        if self._bit_error_rate >= 1.0:
+            return 0
+        return int(math.log(1.0 - self._random.random()) / math.log(1.0 - self._bit_error_rate))
+
+    #
+    # Flip the bits of data that are hit by a bit error.
+    #
+    def _inject_errors(self, link, data):
+        if self._bit_error_rate <= 0.0:
+            return data
+        if link.next_error is None:
+            link.next_error = self._bit_error_interval()
+        bits = len(data) * 8
+        if link.next_error >= bits:
+            link.next_error -= bits
+            return data
+        data = bytearray(data)
+        position = link.next_error
+        while position < bits:
+            data[position // 8] ^= 1 << (position % 8)
+            position += 1 + self._bit_error_interval()
+        link.next_error = position - bits
+        return bytes(data)
+
+    #
+    # Read the data that the source port transmits in the next
+    # slice of the line, and queue it for delivery.
+    #
+    def _transmit(self, link, now):
+        size = self._chunk_size
+        if self._baudrate is not None:
+            size = max(1, int(self._baudrate * self._slice / self._bits_per_char))
+        try:
+            data = os.read(link.source, size)
+        except (BlockingIOError, InterruptedError):
+            return
+        start = link.line_free if now - link.line_free < self._slice else now  # Continue a transmission without drifting.
+        if self._baudrate is not None:
+            link.line_free = start + len(data) * self._bits_per_char / self._baudrate
+        else:
+            link.line_free = now
+        link.queue.append((link.line_free + self._latency, self._inject_errors(link, data)))
+        link.queued += len(data)
+
+    #
+    # Write the data that has arrived to the destination port. Return
+    # the time at which the next data arrives; None when there is none.
+    #
+    def _deliver(self, link, now):
+        link.blocked = False
+        while len(link.queue) != 0:
+            arrival, data = link.queue[0]
+            if arrival > now:
+                return arrival
+            try:
+                size = os.write(link.destination, data)
+            except (BlockingIOError, InterruptedError):
+                size = 0
+            link.queued -= size
+            if size < len(data):
+                link.queue[0] = (arrival, data[size:])
+                link.blocked = True                                            # The receiving port does not read its data.
+                return None
+            link.queue.popleft()
+        return None
+
+    #
+    # Bridge thread: copy the data between the masters of the two
+    # pseudo-terminals, until the pair is closed.
+    #
+    def _bridge(self):
+        links = [_VirtualSerialLink(self._masters[0], self._masters[1]), _VirtualSerialLink(self._masters[1], self._masters[0])]
+        while True:
+            now = time.monotonic()
+            timeout = None
+            events = {self._read_fd: select.POLLIN}
+            for link in links:
+                arrival = self._deliver(link, now)
+                if arrival is not None:
+                    timeout = arrival - now if timeout is None else min(timeout, arrival - now)
+                if link.blocked:
+                    events[link.destination] = events.get(link.destination, 0) | select.POLLOUT
+                if link.queued >= self._queue_limit:
+                    continue                                                   # Stop reading until the data is delivered.
+                if link.line_free > now:
+                    timeout = link.line_free - now if timeout is None else min(timeout, link.line_free - now)
+                else:
+                    events[link.source] = events.get(link.source, 0) | select.POLLIN
+            poller = select.poll()
+            for fd, mask in events.items():
+                poller.register(fd, mask)
+            try:
+                ready = dict(poller.poll(None if timeout is None else max(0.0, timeout) * 1000.0))
+            except InterruptedError:
+                continue
+            if self._read_fd in ready:
+                return
+            now = time.monotonic()
+            for link in links:
+                if ready.get(link.source, 0) & select.POLLIN and link.queued < self._queue_limit and link.line_free <= now:
+                    self._transmit(link, now)
+
+    #
+    # Stop the bridge thread and remove the ports. Any
+    # errors while doing so are ignored.
+    #
+    def close(self):
+        if self._thread is None:
+            return
+        os.write(self._write_fd, b'\0')
+        self._thread.join()
+        self._thread = None
+        for link in self._links:
+            try:
+                os.unlink(link)
+            except OSError:
+                pass
+        for fd in self._masters + self._slaves + [self._read_fd, self._write_fd]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
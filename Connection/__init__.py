@@ -1,2 +1,6 @@
 from .Connection import Connection, ConnectionError
 from .Errors import *
+from .DisconnectEvent import DisconnectEvent
+from .AsyncConnection import AsyncConnection
+from .Multiplexer import Multiplexer
+from .VirtualSerialPair import VirtualSerialPair
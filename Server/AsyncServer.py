@@ -0,0 +1,260 @@
+import os
+import errno
+import socket
+import asyncio
+import logging
+import serial
+from Connection import AsyncConnection, ConnectionError, E_CONNECTION_ABORTED, E_CONNECTION_RESET
+from .Server import ServerError, UNUSED
+from .SocketServer import _SocketServer
+from .Errors import *
+from .Errors import _error2string
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+#
+# Define the asyncio server base class.
+#
+class AsyncServer(object):
+
+    #
+    # Initialize the asyncio server base class.
+    #
+    def __init__(self, server_type, address, handler):
+        if not callable(handler):
+            raise ServerError(E_HANDLER_NOT_CALLABLE, _error2string[E_HANDLER_NOT_CALLABLE])
+        self._server_type = server_type
+        self._address = address
+        self._handler = handler
+        self._tasks = set()
+        self._closed = False
+
+    #
+    # Call the connection handler coroutine, catch the exit status
+    # and handle exceptions. When the handler exits, the connection
+    # is closed. When the handler returns an integral return value,
+    # it is returned. Otherwise the return value is set to 0.
+    #
+    async def _run_handler(self, connection):
+        status = 0
+        self._tasks.add(asyncio.current_task())
+        try:
+            try:
+                status = await self._handler(connection)
+            except socket.error as e:
+                if e.errno in [errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE]:
+                    logger.info("%s: serve_forever() -- %s.", type(self).__name__, e)
+                else:
+                    raise e
+            except ConnectionError as e:
+                if e.error_code in [E_CONNECTION_RESET, E_CONNECTION_ABORTED]:
+                    logger.info("%s: serve_forever() -- %s.", type(self).__name__, e)
+                else:
+                    raise e
+        except asyncio.CancelledError:
+            logger.info("%s: serve_forever() -- Connection cancelled.", type(self).__name__)
+        except Exception as e:
+            logger.exception("%s: serve_forever() -- %s", type(self).__name__, e)
+        finally:
+            self._tasks.discard(asyncio.current_task())
+            await connection.close()                                           # Always close the connection properly.
+            if not isinstance(status, int):
+                status = 0                                                     # When status is not integral, overrule.
+        return status
+
+    #
+    # Abstract coroutine that must be defined in a subclass.
+    #
+    # This coroutine runs the server until close() is called.
+    #
+    async def serve_forever(self):
+        raise NotImplementedError("%s: The serve_forever() method shall be implemented in a subclass" % type(self).__name__)
+
+    #
+    # Stop the server and cancel the running connection handlers.
+    # Must be called from the event loop thread.
+    #
+    def close(self):
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+
+    #
+    # Return an asyncio server instance corresponding to the specified server type.
+    # The handler must be a coroutine function that is called with an AsyncConnection.
+    # The specified server type is case insensitive and can be one of:
+    #
+    # * tcp : create a TCP/IP socket server.
+    # * unix: create a UNIX domain socket server.
+    # * serial: create a serial port server.
+    #
+    # noinspection SpellCheckingInspection
+    @classmethod
+    def create(cls, server_type, handler, *args, **kwargs):
+        #
+        # Map a server type to an instance of a corresponding server class.
+        #
+        server_type = server_type.lower()
+        _server_type2class = {
+            'tcp': lambda _handler, address, port, max_connections=1024: _AsyncTCPSocketServer(server_type, _handler, address, port, max_connections),
+            'unix': lambda _handler, path, max_connections=1024: _AsyncUNIXSocketServer(server_type, _handler, path, max_connections),
+            'serial': lambda _handler, port, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False, rtscts=False, write_timeout=None, dsrdtr=False, inter_byte_timeout=None, exclusive=None: _AsyncSerialServer(server_type, _handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+        }
+        return _server_type2class[server_type](handler, *args, **kwargs)
+
+
+#
+# Define an asyncio socket server base class.
+#
+class _AsyncSocketServer(AsyncServer):
+    def __init__(self, server_type, address, handler, max_connections):
+        super(_AsyncSocketServer, self).__init__(server_type, address, handler)
+        self._max_connections = max_connections
+        self._semaphore = None
+        self._server = None
+
+    #
+    # Abstract coroutine that must be defined in a subclass.
+    #
+    # Return an asyncio.Server that calls callback for
+    # each incoming connection.
+    #
+    async def _start_server(self, callback):
+        raise NotImplementedError("%s: The _start_server() method shall be implemented in a subclass" % type(self).__name__)
+
+    #
+    # Called for each incoming connection. Do not run more than
+    # _max_connections handlers at the same time; connections
+    # beyond the maximum wait until a handler exits.
+    #
+    async def _client_connected(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        connection = AsyncConnection.create(self._server_type, reader, writer, address)
+        if self._semaphore.locked():
+            logger.info("%s: serve_forever() -- Maximum number of connections (%d) reached.", type(self).__name__, self._max_connections)
+        async with self._semaphore:
+            logger.info("%s: serve_forever() -- Incoming connection from: %s.", type(self).__name__, str(address))
+            status = await self._run_handler(connection)
+            logger.info("%s: serve_forever() -- Closed connection from: %s.", type(self).__name__, str(address))
+        UNUSED(status)
+
+    #
+    # Run the socket server until close() is called. Each connection
+    # is handled in its own task.
+    #
+    async def serve_forever(self):
+        self._semaphore = asyncio.Semaphore(self._max_connections)
+        self._server = await self._start_server(self._client_connected)
+        logger.info("%s: serve_forever() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        except asyncio.CancelledError:
+            if not self._closed:
+                raise
+
+    #
+    # Stop accepting connections and cancel the
+    # running connection handlers.
+    #
+    def close(self):
+        super(_AsyncSocketServer, self).close()
+        if self._server is not None:
+            self._server.close()
+
+
+#
+# Define an asyncio TCP/IP socket server.
+#
+class _AsyncTCPSocketServer(_AsyncSocketServer):
+    def __init__(self, server_type, handler, address, port, max_connections):
+        if not _SocketServer._is_ip_address(address):
+            raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
+        if not isinstance(port, int):
+            raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
+        super(_AsyncTCPSocketServer, self).__init__(server_type, (address, port), handler, max_connections)
+
+    async def _start_server(self, callback):
+        return await asyncio.start_server(callback, self._address[0], self._address[1], reuse_address=True)
+
+
+#
+# Define an asyncio Unix socket server.
+#
+class _AsyncUNIXSocketServer(_AsyncSocketServer):
+    def __init__(self, server_type, handler, path, max_connections):
+        if _SocketServer._is_socket(path):
+            os.remove(path)
+        elif os.path.exists(path):
+            raise ServerError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
+        super(_AsyncUNIXSocketServer, self).__init__(server_type, path, handler, max_connections)
+
+    async def _start_server(self, callback):
+        return await asyncio.start_unix_server(callback, self._address)
+
+
+#
+# Define an asyncio serial server. Handle one connection
+# at a time, like the other serial servers.
+#
+class _AsyncSerialServer(AsyncServer):
+    #
+    # Initialize serial port, but do not open it yet.
+    #
+    # noinspection SpellCheckingInspection
+    def __init__(self, server_type, handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive):
+        super(_AsyncSerialServer, self).__init__(server_type, port, handler)
+        self._serial = serial.Serial(None, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+        self._task = None
+
+    #
+    # Close the connection and ignore any
+    # errors while doing so.
+    #
+    def _close_connection(self):
+        try:
+            self._serial.close()
+        except Exception as e:
+            UNUSED(e)
+
+    #
+    # Run the serial server until close() is called. Open the
+    # serial port, run the handler and then handle the next
+    # connection.
+    #
+    async def serve_forever(self):
+        self._task = asyncio.current_task()
+        self._serial.port = self._address
+        try:
+            while not self._closed:
+                logger.info("%s: serve_forever() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
+                try:
+                    self._serial.open()
+                except serial.SerialException as e:
+                    if e.errno in [errno.ENOENT, errno.EACCES]:
+                        await asyncio.sleep(1.0)
+                        continue
+                    else:
+                        raise e
+                self._serial.reset_input_buffer()
+                self._serial.reset_output_buffer()
+                try:
+                    logger.info("%s: serve_forever() -- Incoming connection.", type(self).__name__)
+                    status = await self._run_handler(AsyncConnection.create(self._server_type, self._serial))
+                    UNUSED(status)
+                finally:
+                    logger.info("%s: serve_forever() -- Closed connection.", type(self).__name__)
+                    self._close_connection()
+        except asyncio.CancelledError:
+            if not self._closed:
+                raise
+
+    #
+    # Stop serving and cancel the running connection handler.
+    #
+    def close(self):
+        super(_AsyncSerialServer, self).close()
+        if self._task is not None:
+            self._task.cancel()
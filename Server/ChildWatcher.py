@@ -0,0 +1,104 @@
+import os
+import errno
+import select
+
+
+#
+# Define a child process watcher. The watcher keeps a process file
+# descriptor (pidfd) for each child process, that becomes readable
+# when the child exits. A server can therefore wait for its children
+# together with its other file descriptors in a single poll() call,
+# and only reaps the children that actually exited.
+#
+# When pidfds are not supported (Linux < 5.3, other platforms) the
+# watcher falls back to polling the children every _poll_interval
+# seconds.
+#
+class _ChildWatcher(object):
+    _poll_interval = 0.01
+
+    def __init__(self):
+        self._children = {}                                                    # Map a process id to its (pidfd, data) tuple.
+
+    #
+    # Return the number of watched children.
+    #
+    def __len__(self):
+        return len(self._children)
+
+    #
+    # Return a list of (pid, data) tuples of the watched children.
+    #
+    def items(self):
+        return [(pid, data) for pid, (pidfd, data) in self._children.items()]
+
+    #
+    # Watch the child process with the specified process id. The
+    # data is returned by reap() when the child has exited.
+    #
+    def add(self, pid, data=None):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            pidfd = None
+        self._children[pid] = (pidfd, data)
+
+    #
+    # Wait until a child exits, one of the specified file objects
+    # becomes readable, or the timeout (in seconds) expires. When
+    # timeout is None, wait forever. Return the set of readable file
+    # descriptors of the specified file objects.
+    #
+    def wait(self, fileobjs, timeout=None):
+        poller = select.poll()
+        for fileobj in fileobjs:
+            poller.register(fileobj, select.POLLIN)
+        for pidfd, data in self._children.values():
+            if pidfd is None:
+                if timeout is None or timeout > self._poll_interval:
+                    timeout = self._poll_interval                              # No pidfd; poll the children.
+            else:
+                poller.register(pidfd, select.POLLIN)
+        ready = set(fd for fd, events in poller.poll(None if timeout is None else timeout * 1000.0))
+        return set(fileobj if isinstance(fileobj, int) else fileobj.fileno() for fileobj in fileobjs) & ready
+
+    #
+    # Reap the exited children without blocking. Only the children
+    # with a readable pidfd (or without a pidfd) are waited for. Return
+    # a list of (pid, exit code, data) tuples. The exit code is negative
+    # when the child was terminated by a signal.
+    #
+    def reap(self):
+        exited = []
+        poller = select.poll()
+        for pidfd, data in self._children.values():
+            if pidfd is not None:
+                poller.register(pidfd, select.POLLIN)
+        ready = set(fd for fd, events in poller.poll(0))
+        for pid, (pidfd, data) in list(self._children.items()):
+            if pidfd is not None and pidfd not in ready:
+                continue
+            try:
+                finished_pid, finished_status = os.waitpid(pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise e
+                finished_pid, finished_status = pid, 0                         # The child does not exist anymore.
+            if finished_pid == 0:
+                continue
+            if pidfd is not None:
+                os.close(pidfd)
+            del self._children[pid]
+            exited.append((pid, os.waitstatus_to_exitcode(finished_status), data))
+        return exited
+
+    #
+    # Wait until all children have exited and reap them. Return
+    # a list of (pid, exit code, data) tuples.
+    #
+    def reap_all(self):
+        exited = []
+        while len(self._children) > 0:
+            self.wait([])
+            exited.extend(self.reap())
+        return exited
@@ -4,6 +4,8 @@ E_PATH_EXISTS_BUT_NOT_SOCKET = 3
 E_HANDLER_NOT_CALLABLE = 4
 E_PROCESS_CREATION_ERROR = 5
 E_PARAMETER_IS_NOT_CALLABLE = 6
+E_INVALID_OVERFLOW_POLICY = 7
+E_INVALID_SHARD_MODEL = 8
 
 _error2string = {
     E_INTEGRAL_PORT: "Port number shall be an integral, got: '%r'",
@@ -11,5 +13,7 @@ _error2string = {
     E_PATH_EXISTS_BUT_NOT_SOCKET: "Path already exists but it is not a socket: '%s'",
     E_HANDLER_NOT_CALLABLE: "The handler is not callable",
     E_PROCESS_CREATION_ERROR: "Cannot create connection subprocess",
-    E_PARAMETER_IS_NOT_CALLABLE: "Callable expected for parameter: '%s'"
+    E_PARAMETER_IS_NOT_CALLABLE: "Callable expected for parameter: '%s'",
+    E_INVALID_OVERFLOW_POLICY: "Invalid overflow policy, expected 'block', 'reject' or 'timeout', got: '%r'",
+    E_INVALID_SHARD_MODEL: "Invalid shard model, expected 'iterative', 'threading' or 'evented', got: '%r'"
 }
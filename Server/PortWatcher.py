@@ -0,0 +1,81 @@
+import os
+import glob
+import ctypes
+import ctypes.util
+
+
+#
+# Define a serial port watcher. The watcher expands a list of port
+# names and glob patterns (e.g. '/dev/ttyUSB*') into the names of the
+# ports that exist. On Linux, the watcher holds an inotify file
+# descriptor that becomes readable when a file is created, removed or
+# changes its attributes in one of the directories of the ports, so a
+# server can wait for hot-plugged ports together with its other file
+# descriptors in a single select() call.
+#
+# When inotify is not supported (other platforms, or a directory that
+# does not exist yet), the ports must be rescanned every _rescan_interval
+# seconds.
+#
+class _PortWatcher(object):
+    _rescan_interval = 1.0
+    _events = 0x00000004 | 0x00000080 | 0x00000100 | 0x00000200                # IN_ATTRIB | IN_MOVED_TO | IN_CREATE | IN_DELETE.
+
+    def __init__(self, patterns):
+        self._patterns = patterns
+        self._fd = None
+        self._complete = False                                                 # All directories are watched.
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError):
+            return                                                             # No inotify; rescan periodically.
+        if fd < 0:
+            return
+        self._fd = fd
+        self._complete = True
+        for directory in set(os.path.dirname(pattern) or '.' for pattern in patterns):
+            if libc.inotify_add_watch(fd, os.fsencode(directory), self._events) < 0:
+                self._complete = False                                         # E.g. the directory does not exist (yet).
+
+    #
+    # Return the file descriptor that becomes readable when the
+    # ports may have changed; None when there is none.
+    #
+    def fileno(self):
+        return self._fd
+
+    #
+    # Return the number of seconds after which the ports must be
+    # rescanned; None when the file descriptor reports all changes.
+    #
+    @property
+    def timeout(self):
+        return None if self._complete else self._rescan_interval
+
+    #
+    # Discard the pending change notifications.
+    #
+    def drain(self):
+        try:
+            while len(os.read(self._fd, 65536)) != 0:
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    #
+    # Return the sorted list of the names of the existing ports.
+    #
+    def ports(self):
+        names = set()
+        for pattern in self._patterns:
+            names.update(glob.glob(pattern))
+        return sorted(names)
+
+    #
+    # Close the file descriptor.
+    #
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -1,12 +1,18 @@
 import os
+import time
 import errno
+import fnmatch
 import serial
 import threading
+import selectors
+import queue
+import collections
 import logging
-import time
-from multiprocessing import Pipe
-from Connection import Connection, ConnectionError, E_CONNECTION_ABORTED, E_CONNECTION_RESET
-from .Server import Server, ServerError, UNUSED
+from Connection import Connection, DisconnectEvent, ConnectionError, E_CONNECTION_ABORTED, E_CONNECTION_RESET
+from .Server import Server, ServerError, UNUSED, _ServeMonitor
+from .SocketServer import _WakeupPipe
+from .ChildWatcher import _ChildWatcher
+from .PortWatcher import _PortWatcher
 from .Errors import *
 from .Errors import _error2string
 
@@ -53,33 +59,28 @@ class _SerialServer(Server):
 # Define a forking serial server.
 #
 class _ForkingSerialServer(_SerialServer):
+    # noinspection SpellCheckingInspection
+    def __init__(self, server_type, handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive, exit_handler):
+        if exit_handler is not None and not callable(exit_handler):
+            raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "exit_handler")
+        super(_ForkingSerialServer, self).__init__(server_type, handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+        self._exit_handler = exit_handler
+
     #
-    # Return True when the parent process
-    # requests a disconnect.
+    # Called when the handler exited. The status is the return value
+    # of the handler, or the negative signal number when the child
+    # process was killed.
     #
-    @staticmethod
-    def _disconnect(pipe_read):
-        #
-        # Closure function.
-        #
-        # When the parent send the 'disconnect' message
-        # this indicates that we are requested to disconnect
-        # from the client and terminate the handler.
-        #
-        def _closure():
-            disconnect = False
-            if pipe_read.poll():
-                message = pipe_read.recv_bytes()
-                if message.decode() == 'disconnect':
-                    disconnect = True
-            return disconnect
-        return _closure
+    def _handler_exited(self, status):
+        logger.info("%s: serve_until() -- Handler exited with status: %d.", type(self).__name__, status)
+        if self._exit_handler is not None:
+            self._exit_handler(self._address, status)
 
     #
     # Run the serial server forever.
     #
     def serve_forever(self):
-        self.serve_until(lambda: True)
+        self.serve_until(self._forever)
 
     #
     # Run the serial server as long as the serve callable returns True.
@@ -88,25 +89,26 @@ class _ForkingSerialServer(_SerialServer):
     #
     # When the handler exits, the connection is closed. When the handler
     # as an integral return value, it is returned to the parent process.
-    # Otherwise the return value is set to 0.
+    # Otherwise the return value is set to 0. The parent process passes
+    # the return value to the exit handler.
     #
     def serve_until(self, serve):
         if not callable(serve):
             raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
         self._serial.port = self._address
-        while serve():
+        while self._serving(serve):
             logger.info("%s: serve_until() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
             try:
                 self._serial.open()
             except serial.SerialException as e:
                 if e.errno in [errno.ENOENT, errno.EACCES]:
-                    time.sleep(1.0)
+                    self._shutdown.wait(1.0)
                     continue
                 else:
                     raise e
             self._serial.reset_input_buffer()
             self._serial.reset_output_buffer()
-            pipe_read, pipe_write = Pipe(False)                                # Create an unidirectional pipe; only send data from parent to child process.
+            disconnect = DisconnectEvent()
             pid = os.fork()
             if pid < 0:
                 raise ServerError(E_PROCESS_CREATION_ERROR, _error2string[E_PROCESS_CREATION_ERROR])
@@ -115,7 +117,7 @@ class _ForkingSerialServer(_SerialServer):
                 try:
                     try:
                         logger.info("%s: serve_until() -- Incoming connection.", type(self).__name__)
-                        status = self._handler(Connection.create(self._server_type, self._serial, self._disconnect(pipe_read)))
+                        status = self._handler(Connection.create(self._server_type, self._serial, disconnect))
                     except ConnectionError as e:
                         if e.error_code in [E_CONNECTION_RESET, E_CONNECTION_ABORTED]:
                             logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
@@ -131,24 +133,19 @@ class _ForkingSerialServer(_SerialServer):
                     os._exit(status)                                           # Exit the child process.
             else:
                 logger.info("%s: serve_until() -- Maximum number of connections (%d) reached.", type(self).__name__, 1)
-                while serve():
-                    finished_pid = 0
-                    try:
-                        finished_pid, finished_status = os.waitpid(pid, os.WNOHANG)
-                    except OSError as e:
-                        if e.errno != errno.ECHILD:
-                            raise e
-                        #
-                        # The child process does not exist anymore, we
-                        # can therefor break from the loop.
-                        #
-                        finished_pid = pid
-                    finally:
-                        if finished_pid != 0:
-                            break
-                pipe_write.send_bytes('disconnect'.encode())                   # Send the disconnect message.
-                pipe_write.close()                                             # Close our end of the pipe.
+                children = _ChildWatcher()
+                children.add(pid)
+                exited = []
+                while self._serving(serve) and len(exited) == 0:
+                    children.wait([self._shutdown], self._serve_interval(serve))  # Wait until the child exits.
+                    exited = children.reap()
+                if len(exited) == 0:
+                    disconnect.set()                                           # Request the child to disconnect.
+                    exited = children.reap_all()
+                disconnect.close()
                 self._close_connection()                                       # When the child has exited, close the connection.
+                for pid, status, data in exited:
+                    self._handler_exited(status)
 
 
 #
@@ -196,7 +193,7 @@ class _ThreadingSerialServer(_SerialServer):
     # Run the serial server forever.
     #
     def serve_forever(self):
-        self.serve_until(lambda: True)
+        self.serve_until(self._forever)
 
     #
     # Run the serial server as long as the serve callable returns True.
@@ -211,20 +208,21 @@ class _ThreadingSerialServer(_SerialServer):
         if not callable(serve):
             raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
         self._serial.port = self._address
-        while serve():
+        monitor = _ServeMonitor(self, serve)
+        while self._serving(serve):
             logger.info("%s: serve_until() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
             try:
                 self._serial.open()
             except serial.SerialException as e:
                 if e.errno in [errno.ENOENT, errno.EACCES]:
-                    time.sleep(1.0)
+                    self._shutdown.wait(1.0)
                     continue
                 else:
                     raise e
             self._serial.reset_input_buffer()
             self._serial.reset_output_buffer()
             logger.info("%s: serve_until() -- Incoming connection.", type(self).__name__)
-            thread = _ThreadingSerialServer.HandlerThread(target=self._handler, args=(Connection.create(self._server_type, self._serial, lambda: not serve()),))
+            thread = _ThreadingSerialServer.HandlerThread(target=self._handler, args=(Connection.create(self._server_type, self._serial, monitor.disconnect),))
             logger.info("%s: serve_until() -- Maximum number of connections (%d) reached.", type(self).__name__, 1)
             thread.start()
             thread.join()
@@ -232,6 +230,7 @@ class _ThreadingSerialServer(_SerialServer):
             # Here, thread.status contains the handler's exit status.
             #
             self._close_connection()                                           # When the child has exited, close the connection.
+        monitor.close()
 
 
 #
@@ -242,7 +241,7 @@ class _IterativeSerialServer(_SerialServer):
     # Run the serial server forever.
     #
     def serve_forever(self):
-        self.serve_until(lambda: True)
+        self.serve_until(self._forever)
 
     #
     # Run the serial server as long as the serve callable returns True.
@@ -257,13 +256,14 @@ class _IterativeSerialServer(_SerialServer):
         if not callable(serve):
             raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
         self._serial.port = self._address
-        while serve():
+        monitor = _ServeMonitor(self, serve)
+        while self._serving(serve):
             logger.info("%s: serve_until() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
             try:
                 self._serial.open()
             except serial.SerialException as e:
                 if e.errno in [errno.ENOENT, errno.EACCES]:
-                    time.sleep(1.0)
+                    self._shutdown.wait(1.0)
                     continue
                 else:
                     raise e
@@ -273,7 +273,7 @@ class _IterativeSerialServer(_SerialServer):
             try:
                 try:
                     logger.info("%s: serve_until() -- Incoming connection.", type(self).__name__)
-                    status = self._handler(Connection.create(self._server_type, self._serial, lambda: not serve()))
+                    status = self._handler(Connection.create(self._server_type, self._serial, monitor.disconnect))
                 except ConnectionError as e:
                     if e.error_code in [E_CONNECTION_RESET, E_CONNECTION_ABORTED]:
                         logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
@@ -287,3 +287,283 @@ class _IterativeSerialServer(_SerialServer):
                 if not isinstance(status, int):
                     status = 0                                                 # When status is not integral, overrule.
             UNUSED(status)
+        monitor.close()
+
+
+#
+# Define a port of a multi-port serial server.
+#
+class _MultiPortSerialPort(object):
+    def __init__(self, name, serial_, connection, handler):
+        self.name = name
+        self.serial = serial_
+        self.connection = connection
+        self.handler = handler
+        self.busy = False                                                      # A handler call is queued or running.
+        self.received = False                                                  # Data was received during the call.
+        self.paused = False                                                    # Reading paused; the receive buffer is full.
+        self.removed = False                                                   # The port was unplugged.
+
+
+#
+# Define a multi-port serial server.
+#
+class _MultiPortSerialServer(Server):
+    _chunk_size = 65536
+
+    #
+    # Initialize the server, but do not open the ports yet. The ports
+    # are a port name or glob pattern, or a list of these. Handlers maps
+    # port names or glob patterns to the handler of the matching ports;
+    # the other ports use the handler.
+    #
+    # noinspection SpellCheckingInspection
+    def __init__(self, server_type, handler, ports, handlers, workers, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive):
+        patterns = [ports] if isinstance(ports, str) else list(ports)
+        handlers = {} if handlers is None else dict(handlers)
+        for port_handler in handlers.values():
+            if not callable(port_handler):
+                raise ServerError(E_HANDLER_NOT_CALLABLE, _error2string[E_HANDLER_NOT_CALLABLE])
+        super(_MultiPortSerialServer, self).__init__(server_type, tuple(patterns), handler)
+        self._handlers = handlers
+        self._workers = max(1, workers)
+        self._settings = (baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+
+    #
+    # Return the handler of the port with the specified name.
+    #
+    def _port_handler(self, name):
+        for pattern, handler in self._handlers.items():
+            if fnmatch.fnmatch(name, pattern):
+                return handler
+        return self._handler
+
+    #
+    # Open the port with the specified name. Return None when the
+    # port cannot be opened (yet); it is retried when the ports change.
+    #
+    def _open_port(self, name, disconnect):
+        serial_ = serial.Serial(None, *self._settings)
+        serial_.port = name
+        try:
+            serial_.open()
+        except serial.SerialException as e:
+            if e.errno not in [errno.ENOENT, errno.EACCES, errno.EBUSY]:
+                logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
+            return None
+        serial_.reset_input_buffer()
+        serial_.reset_output_buffer()
+        return _MultiPortSerialPort(name, serial_, Connection.create_multiplexed(self._server_type, serial_, disconnect), self._port_handler(name))
+
+    #
+    # Open the ports that appeared, and register them in the selector.
+    #
+    def _scan_ports(self, selector, ports, watcher, wakeup, disconnect):
+        for name in watcher.ports():
+            if name in ports:
+                continue
+            port = self._open_port(name, disconnect)
+            if port is not None:
+                logger.info("%s: serve_until() -- Opened port: %s.", type(self).__name__, name)
+                port.connection._set_drained_callback(wakeup.wake)
+                ports[name] = port
+                selector.register(port.serial.fileno(), selectors.EVENT_READ, port)
+
+    #
+    # Close a port and forget it, so it is opened again when it
+    # re-appears.
+    #
+    def _close_port(self, ports, port):
+        logger.info("%s: serve_until() -- Closed port: %s.", type(self).__name__, port.name)
+        del ports[port.name]
+        try:
+            port.serial.close()
+        except Exception as e:
+            UNUSED(e)
+
+    #
+    # Stop reading a port that was unplugged. The running handler (if
+    # any) sees a connection reset; the port is closed when it returns.
+    #
+    def _remove_port(self, selector, ports, port, exception):
+        logger.info("%s: serve_until() -- Lost port: %s.", type(self).__name__, port.name)
+        if not port.paused:
+            selector.unregister(port.serial.fileno())
+        port.removed = True
+        port.connection._connection_lost(exception)
+        if not port.busy:
+            self._close_port(ports, port)
+
+    #
+    # Queue a call of the handler of a port, unless one is
+    # queued or running already.
+    #
+    @staticmethod
+    def _schedule_call(calls, port):
+        if port.busy:
+            port.received = True
+        else:
+            port.busy, port.received = True, False
+            calls.put(port)
+
+    #
+    # Read the data that is available at a port, and feed it into
+    # its connection. Pause reading when the receive buffer is full.
+    #
+    def _read_port(self, selector, calls, ports, port):
+        try:
+            data = os.read(port.serial.fileno(), self._chunk_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._remove_port(selector, ports, port, serial.SerialException(e.errno, str(e)))
+            return
+        if len(data) == 0:
+            self._remove_port(selector, ports, port, serial.SerialException(errno.EIO, os.strerror(errno.EIO)))
+            return
+        if port.connection._feed(data):
+            selector.unregister(port.serial.fileno())
+            port.paused = True
+        self._schedule_call(calls, port)
+
+    #
+    # Handle the calls that returned, and resume reading the ports
+    # whose receive buffer drained. When data was received during a
+    # call, queue a new one. When the handler left a full receive
+    # buffer, the received data is discarded.
+    #
+    def _wakeup(self, selector, calls, finished, ports):
+        while len(finished) != 0:
+            port = finished.popleft()
+            port.busy = False
+            if port.removed:
+                self._close_port(ports, port)
+                continue
+            if port.connection._discard_overflow():
+                logger.info("%s: serve_until() -- Receive buffer overflow at: %s, discarded the received data.", type(self).__name__, port.name)
+            elif port.received:
+                self._schedule_call(calls, port)
+        for port in list(ports.values()):
+            if port.paused and not port.removed and port.connection._resume():
+                selector.register(port.serial.fileno(), selectors.EVENT_READ, port)
+                port.paused = False
+
+    #
+    # Call the handler of a port. Return the exit status of the handler.
+    #
+    def _call_handler(self, port):
+        status = 0
+        try:
+            try:
+                status = port.handler(port.connection)
+            except ConnectionError as e:
+                if e.error_code in [E_CONNECTION_RESET, E_CONNECTION_ABORTED]:
+                    logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
+                else:
+                    raise e
+        except Exception as e:
+            logger.exception("%s: serve_until() -- %s.", type(self).__name__, e)
+        finally:
+            if not isinstance(status, int):
+                status = 0                                                     # When status is not integral, overrule.
+        return status
+
+    #
+    # Run the queued handler calls until None is dequeued.
+    #
+    def _worker(self, calls, finished, wakeup):
+        while True:
+            port = calls.get()
+            if port is None:
+                break
+            status = self._call_handler(port)
+            UNUSED(status)
+            finished.append(port)
+            wakeup.wake()
+
+    #
+    # Run the serial server forever.
+    #
+    def serve_forever(self):
+        self.serve_until(self._forever)
+
+    #
+    # Run the serial server as long as the serve callable returns True.
+    # All ports are read in a single selector loop; neither fork() nor
+    # create a thread per port. The ports stay open while the server
+    # runs. When data arrives at a port, its handler is called with the
+    # connection of the port by one of the worker threads. The handler
+    # is never called for the same port concurrently; when data arrives
+    # during a call, the handler is called again after it.
+    #
+    # Like the handler of an evented server, the handler must not wait
+    # for data: the connection returns received data, and complete lines
+    # and messages, only when these are available. The data the handler
+    # does not consume stays buffered. The return value of the handler
+    # is currently unused.
+    #
+    # Ports that appear are opened as soon as the port watcher reports
+    # them. When a port is unplugged, it is closed; a running handler
+    # sees a connection reset.
+    #
+    def serve_until(self, serve):
+        if not callable(serve):
+            raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
+        ports = {}
+        calls = queue.Queue()
+        finished = collections.deque()
+        wakeup = _WakeupPipe()
+        watcher = _PortWatcher(self._address)
+        disconnect = DisconnectEvent()                                         # Set when the server stops serving.
+        selector = selectors.DefaultSelector()
+        selector.register(self._shutdown, selectors.EVENT_READ)
+        selector.register(wakeup, selectors.EVENT_READ)
+        if watcher.fileno() is not None:
+            selector.register(watcher, selectors.EVENT_READ)
+        workers = [threading.Thread(target=self._worker, args=(calls, finished, wakeup)) for _ in range(self._workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            logger.info("%s: serve_until() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
+            scan, next_scan = True, None
+            while self._serving(serve):
+                if scan or (next_scan is not None and time.monotonic() >= next_scan):
+                    self._scan_ports(selector, ports, watcher, wakeup, disconnect)
+                    scan = False
+                    next_scan = None if watcher.timeout is None else time.monotonic() + watcher.timeout
+                timeout = self._serve_interval(serve)
+                if next_scan is not None:
+                    remaining = max(0.0, next_scan - time.monotonic())
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                for key, events in selector.select(timeout):
+                    if key.fileobj is self._shutdown:
+                        break
+                    elif key.fileobj is wakeup:
+                        wakeup.drain()
+                        self._wakeup(selector, calls, finished, ports)
+                    elif key.fileobj is watcher:
+                        watcher.drain()
+                        scan = True
+                    elif ports.get(key.data.name) is key.data:
+                        self._read_port(selector, calls, ports, key.data)
+        finally:
+            #
+            # Request the handlers to disconnect, drop the calls that
+            # did not run yet, stop the workers and close all ports.
+            #
+            disconnect.set()
+            while True:
+                try:
+                    calls.get_nowait()
+                except queue.Empty:
+                    break
+            for worker in workers:
+                calls.put(None)
+            for worker in workers:
+                worker.join()
+            for port in list(ports.values()):
+                self._close_port(ports, port)
+            selector.close()
+            watcher.close()
+            wakeup.close()
+            disconnect.close()
@@ -1,4 +1,8 @@
+import socket
+import select
+import threading
 import serial
+from Connection import DisconnectEvent
 from .Errors import *
 from .Errors import _error2string
 
@@ -17,6 +21,44 @@ class ServerError(Exception):
         self.error_code = error_code
 
 
+#
+# Define a serve monitor. The monitor holds the disconnect event that is
+# passed to the connections of a single serve_until() run. A monitor
+# thread sets the event as soon as the server is shut down, or the serve
+# callable returns False; the serve callable is re-evaluated every serve
+# interval. The connections therefore only check and wait for the event,
+# and never call the serve callable themselves.
+#
+class _ServeMonitor(object):
+    def __init__(self, server, serve):
+        self.disconnect = DisconnectEvent()
+        self._thread = threading.Thread(target=self._monitor, args=(server, serve), daemon=True)
+        self._thread.start()
+
+    #
+    # Set the disconnect event when the server stops serving.
+    #
+    def _monitor(self, server, serve):
+        interval = server._serve_interval(serve)
+        poller = select.poll()
+        poller.register(server._shutdown, select.POLLIN)
+        poller.register(self.disconnect, select.POLLIN)
+        while not self.disconnect.is_set():
+            if not server._serving(serve):
+                self.disconnect.set()
+                break
+            poller.poll(None if interval is None else interval * 1000.0)
+
+    #
+    # Set the disconnect event, stop the monitor thread and
+    # close the event.
+    #
+    def close(self):
+        self.disconnect.set()
+        self._thread.join()
+        self.disconnect.close()
+
+
 #
 # Define the server base class.
 #
@@ -31,6 +73,38 @@ class Server(object):
         self._server_type = server_type
         self._address = address
         self._handler = handler
+        self._shutdown = DisconnectEvent()
+
+    #
+    # Stop the server. The server wakes up immediately, requests the
+    # running handlers to disconnect and returns from serve_forever()
+    # or serve_until(). Can be called from any thread, and from a signal
+    # handler. A server that is shut down cannot be restarted.
+    #
+    def shutdown(self):
+        self._shutdown.set()
+
+    #
+    # Return True as long as the server is not shut
+    # down and the serve callable returns True.
+    #
+    def _serving(self, serve):
+        return not self._shutdown.is_set() and serve()
+
+    #
+    # The serve callable used by serve_forever().
+    #
+    @staticmethod
+    def _forever():
+        return True
+
+    #
+    # Return the number of seconds after which a waiting server must
+    # re-evaluate the serve callable. The serve callable of serve_forever()
+    # never changes, so only shutdown() wakes up the server (None).
+    #
+    def _serve_interval(self, serve):
+        return None if serve is self._forever else 1.0
 
     #
     # Abstract method that must be defined in a subclass.
@@ -52,12 +126,18 @@ class Server(object):
 
     #
     # Return a forking server instance corresponding to the specified server type.
-    # The specified server type is case insensitive and can be one of:
+    # When an exit_handler callable is specified, it is called with the address
+    # and the exit status of each handler that exits (the negative signal number
+    # when the handler's process was killed). The specified server type is case
+    # insensitive and can be one of:
     #
     # * tcp : create a TCP/IP socket server.
     # * unix: create a UNIX domain socket server.
     # * serial: create a serial port server.
     #
+    # The socket servers accept the listen backlog as keyword argument;
+    # socket.SOMAXCONN when not specified.
+    #
     # noinspection SpellCheckingInspection
     @classmethod
     def create_forking(cls, server_type, handler, *args, **kwargs):
@@ -71,9 +151,38 @@ class Server(object):
         #
         server_type = server_type.lower()
         _server_type2class = {
-            'tcp': lambda _handler, address, port, max_connections=1: _ForkingTCPSocketServer(server_type, _handler, address, port, max_connections),
-            'unix': lambda _handler, path, max_connections=1: _ForkingUNIXSocketServer(server_type, _handler, path, max_connections),
-            'serial': lambda _handler, port, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False, rtscts=False, write_timeout=None, dsrdtr=False, inter_byte_timeout=None, exclusive=None: _ForkingSerialServer(server_type, _handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+            'tcp': lambda _handler, address, port, max_connections=1, backlog=socket.SOMAXCONN, exit_handler=None: _ForkingTCPSocketServer(server_type, _handler, address, port, max_connections, backlog, exit_handler),
+            'unix': lambda _handler, path, max_connections=1, backlog=socket.SOMAXCONN, exit_handler=None: _ForkingUNIXSocketServer(server_type, _handler, path, max_connections, backlog, exit_handler),
+            'serial': lambda _handler, port, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False, rtscts=False, write_timeout=None, dsrdtr=False, inter_byte_timeout=None, exclusive=None, exit_handler=None: _ForkingSerialServer(server_type, _handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive, exit_handler)
+        }
+        return _server_type2class[server_type](handler, *args, **kwargs)
+
+    #
+    # Return a pre-forking server instance corresponding to the specified server type.
+    # A fixed number of worker processes (workers; the number of CPUs when None) accept
+    # and handle connections. A worker is replaced after it handled
+    # max_requests_per_worker connections (never when None). The specified server
+    # type is case insensitive and can be one of:
+    #
+    # * tcp : create a TCP/IP socket server.
+    # * unix: create a UNIX domain socket server.
+    #
+    # The socket servers accept the listen backlog as keyword argument;
+    # socket.SOMAXCONN when not specified.
+    #
+    @classmethod
+    def create_preforking(cls, server_type, handler, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .SocketServer import _PreforkingTCPSocketServer, _PreforkingUNIXSocketServer
+        #
+        # Map a server type to an instance of a corresponding server class.
+        #
+        server_type = server_type.lower()
+        _server_type2class = {
+            'tcp': lambda _handler, address, port, workers=None, max_requests_per_worker=None, backlog=socket.SOMAXCONN: _PreforkingTCPSocketServer(server_type, _handler, address, port, workers, max_requests_per_worker, backlog),
+            'unix': lambda _handler, path, workers=None, max_requests_per_worker=None, backlog=socket.SOMAXCONN: _PreforkingUNIXSocketServer(server_type, _handler, path, workers, max_requests_per_worker, backlog)
         }
         return _server_type2class[server_type](handler, *args, **kwargs)
 
@@ -85,6 +194,9 @@ class Server(object):
     # * unix: create a UNIX domain socket server.
     # * serial: create a serial port server.
     #
+    # The socket servers accept the listen backlog as keyword argument;
+    # socket.SOMAXCONN when not specified.
+    #
     # noinspection SpellCheckingInspection
     @classmethod
     def create_threading(cls, server_type, handler, *args, **kwargs):
@@ -98,12 +210,128 @@ class Server(object):
         #
         server_type = server_type.lower()
         _server_type2class = {
-            'tcp': lambda _handler, address, port, max_connections=1: _ThreadingTCPSocketServer(server_type, _handler, address, port, max_connections),
-            'unix': lambda _handler, path, max_connections=1: _ThreadingUNIXSocketServer(server_type, _handler, path, max_connections),
+            'tcp': lambda _handler, address, port, max_connections=1, backlog=socket.SOMAXCONN: _ThreadingTCPSocketServer(server_type, _handler, address, port, max_connections, backlog),
+            'unix': lambda _handler, path, max_connections=1, backlog=socket.SOMAXCONN: _ThreadingUNIXSocketServer(server_type, _handler, path, max_connections, backlog),
             'serial': lambda _handler, port, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False, rtscts=False, write_timeout=None, dsrdtr=False, inter_byte_timeout=None, exclusive=None: _ThreadingSerialServer(server_type, _handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
         }
         return _server_type2class[server_type](handler, *args, **kwargs)
 
+    #
+    # Return a pooled threading server instance corresponding to the specified server
+    # type. A fixed number of reusable worker threads (workers) handle the accepted
+    # connections, which wait in a queue of at most queue_size connections. The
+    # overflow policy ('block', 'reject' or 'timeout') determines what happens to
+    # a connection when the queue is full; with 'timeout', a connection waits at
+    # most overflow_timeout seconds for a free slot. The specified server type is
+    # case insensitive and can be one of:
+    #
+    # * tcp : create a TCP/IP socket server.
+    # * unix: create a UNIX domain socket server.
+    #
+    # The socket servers accept the listen backlog as keyword argument;
+    # socket.SOMAXCONN when not specified.
+    #
+    @classmethod
+    def create_pooled(cls, server_type, handler, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .SocketServer import _PooledTCPSocketServer, _PooledUNIXSocketServer
+        #
+        # Map a server type to an instance of a corresponding server class.
+        #
+        server_type = server_type.lower()
+        _server_type2class = {
+            'tcp': lambda _handler, address, port, workers=8, queue_size=64, overflow='block', overflow_timeout=1.0, backlog=socket.SOMAXCONN: _PooledTCPSocketServer(server_type, _handler, address, port, workers, queue_size, overflow, overflow_timeout, backlog),
+            'unix': lambda _handler, path, workers=8, queue_size=64, overflow='block', overflow_timeout=1.0, backlog=socket.SOMAXCONN: _PooledUNIXSocketServer(server_type, _handler, path, workers, queue_size, overflow, overflow_timeout, backlog)
+        }
+        return _server_type2class[server_type](handler, *args, **kwargs)
+
+    #
+    # Return an evented server instance corresponding to the specified server type.
+    # All connections are multiplexed in a single selector loop. The specified
+    # server type is case insensitive and can be one of:
+    #
+    # * tcp : create a TCP/IP socket server.
+    # * unix: create a UNIX domain socket server.
+    #
+    # The socket servers accept the listen backlog as keyword argument;
+    # socket.SOMAXCONN when not specified.
+    #
+    @classmethod
+    def create_evented(cls, server_type, handler, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .SocketServer import _EventedTCPSocketServer, _EventedUNIXSocketServer
+        #
+        # Map a server type to an instance of a corresponding server class.
+        #
+        server_type = server_type.lower()
+        _server_type2class = {
+            'tcp': lambda _handler, address, port, max_connections=1024, backlog=socket.SOMAXCONN: _EventedTCPSocketServer(server_type, _handler, address, port, max_connections, backlog),
+            'unix': lambda _handler, path, max_connections=1024, backlog=socket.SOMAXCONN: _EventedUNIXSocketServer(server_type, _handler, path, max_connections, backlog)
+        }
+        return _server_type2class[server_type](handler, *args, **kwargs)
+
+    #
+    # Return a sharded server instance corresponding to the specified server type.
+    # The server starts a number of shard processes (shards; the number of CPUs
+    # when None), and restarts a shard when it exits. Each shard runs a server
+    # of the specified model ('iterative', 'threading' or 'evented') that binds
+    # the same address with SO_REUSEPORT, so the kernel distributes the incoming
+    # connections over the shards. Any additional keyword arguments (e.g.
+    # max_connections) are passed to the server of each shard. The specified
+    # server type is case insensitive and can be one of:
+    #
+    # * tcp : create a TCP/IP socket server.
+    #
+    # The socket servers accept the listen backlog as keyword argument;
+    # socket.SOMAXCONN when not specified.
+    #
+    @classmethod
+    def create_sharded(cls, server_type, handler, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .SocketServer import _ShardedTCPSocketServer
+        #
+        # Map a server type to an instance of a corresponding server class.
+        #
+        server_type = server_type.lower()
+        _server_type2class = {
+            'tcp': lambda _handler, address, port, shards=None, model='threading', backlog=socket.SOMAXCONN, **options: _ShardedTCPSocketServer(server_type, _handler, address, port, shards, model, backlog, options)
+        }
+        return _server_type2class[server_type](handler, *args, **kwargs)
+
+    #
+    # Return a multi-port server instance corresponding to the specified server type.
+    # The server serves all ports that match ports, a port name or glob pattern (e.g.
+    # '/dev/ttyUSB*') or a list of these, from a single selector loop. Ports that are
+    # plugged in are opened when they appear. When data arrives at a port, its handler
+    # is called by one of a fixed number of worker threads (workers); as for an evented
+    # server, the handler must not wait for data. Handlers optionally maps port names or
+    # glob patterns to the handler of the matching ports. The specified server type is
+    # case insensitive and can be one of:
+    #
+    # * serial: create a serial port server.
+    #
+    # noinspection SpellCheckingInspection
+    @classmethod
+    def create_multiport(cls, server_type, handler, *args, **kwargs):
+        #
+        # Avoid circular imports.
+        #
+        from .SerialServer import _MultiPortSerialServer
+        #
+        # Map a server type to an instance of a corresponding server class.
+        #
+        server_type = server_type.lower()
+        _server_type2class = {
+            'serial': lambda _handler, ports, handlers=None, workers=8, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False, rtscts=False, write_timeout=None, dsrdtr=False, inter_byte_timeout=None, exclusive=None: _MultiPortSerialServer(server_type, _handler, ports, handlers, workers, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
+        }
+        return _server_type2class[server_type](handler, *args, **kwargs)
+
     #
     # Return an iterative server instance corresponding to the specified server type.
     # The specified server type is case insensitive and can be one of:
@@ -112,6 +340,9 @@ class Server(object):
     # * unix: create a UNIX domain socket server.
     # * serial: create a serial port server.
     #
+    # The socket servers accept the listen backlog as keyword argument;
+    # socket.SOMAXCONN when not specified.
+    #
     # noinspection SpellCheckingInspection
     @classmethod
     def create_iterative(cls, server_type, handler, *args, **kwargs):
@@ -125,8 +356,8 @@ class Server(object):
         #
         server_type = server_type.lower()
         _server_type2class = {
-            'tcp': lambda _handler, address, port: _IterativeTCPSocketServer(server_type, _handler, address, port),
-            'unix': lambda _handler, path: _IterativeUNIXSocketServer(server_type, _handler, path),
+            'tcp': lambda _handler, address, port, backlog=socket.SOMAXCONN: _IterativeTCPSocketServer(server_type, _handler, address, port, backlog),
+            'unix': lambda _handler, path, backlog=socket.SOMAXCONN: _IterativeUNIXSocketServer(server_type, _handler, path, backlog),
             'serial': lambda _handler, port, baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False, rtscts=False, write_timeout=None, dsrdtr=False, inter_byte_timeout=None, exclusive=None: _IterativeSerialServer(server_type, _handler, port, baudrate, bytesize, parity, stopbits, timeout, xonxoff, rtscts, write_timeout, dsrdtr, inter_byte_timeout, exclusive)
         }
         return _server_type2class[server_type](handler, *args, **kwargs)
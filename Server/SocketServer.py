@@ -1,13 +1,17 @@
 import os
 import stat
 import errno
+import inspect
 import time
 import socket
+import select
+import selectors
 import threading
+import queue
 import logging
-from multiprocessing import Pipe
-from Connection import Connection
-from .Server import Server, ServerError, UNUSED
+from Connection import Connection, ConnectionError, DisconnectEvent
+from .Server import Server, ServerError, UNUSED, _ServeMonitor
+from .ChildWatcher import _ChildWatcher
 from .Errors import *
 from .Errors import _error2string
 
@@ -15,20 +19,74 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+#
+# Define a wakeup pipe. A thread wakes up a server that waits for the
+# pipe to become readable, together with its other file descriptors.
+#
+class _WakeupPipe(object):
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+
+    #
+    # Return the file descriptor that becomes
+    # readable when the pipe is woken up.
+    #
+    def fileno(self):
+        return self._read_fd
+
+    #
+    # Wake up the waiting server.
+    #
+    def wake(self):
+        try:
+            os.write(self._write_fd, b'\0')
+        except (BlockingIOError, OSError):
+            pass                                                               # The pipe is full or closed; it is readable anyway.
+
+    #
+    # Read all pending wakeups.
+    #
+    def drain(self):
+        try:
+            while len(os.read(self._read_fd, 4096)) > 0:
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    #
+    # Close the pipe.
+    #
+    def close(self):
+        for fd in (self._read_fd, self._write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
 #
 # Define a socket server base class.
 #
 class _SocketServer(Server):
+    _reuse_port = False
+
     #
-    # Initialize a socket server.
+    # Initialize a socket server. When _reuse_port is set, other
+    # sockets may bind the same address (SO_REUSEPORT) and the
+    # kernel distributes the incoming connections over them.
     #
-    def __init__(self, server_type, family, type_, address, handler, max_connections):
+    def __init__(self, server_type, family, type_, address, handler, max_connections, backlog):
         super(_SocketServer, self).__init__(server_type, address, handler)
         self._socket = socket.socket(family, type_)
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._socket.settimeout(1.0)
+        if self._reuse_port:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._socket.setblocking(False)                                        # Wait for connections with poll().
         self._socket.bind(self._address)
         self._max_connections = max_connections
+        self._backlog = backlog
 
     #
     # Close a connection and ignore any errors
@@ -42,6 +100,67 @@ class _SocketServer(Server):
         except Exception as e:
             UNUSED(e)
 
+    #
+    # Wait until one of the specified file objects is readable, or the
+    # server is shut down. Return after the serve interval at the latest,
+    # so the caller re-evaluates the serve callable. Return the set of
+    # readable file descriptors; empty on a timeout.
+    #
+    def _wait(self, serve, fileobjs):
+        interval = self._serve_interval(serve)
+        poller = select.poll()
+        poller.register(self._shutdown, select.POLLIN)
+        for fileobj in fileobjs:
+            poller.register(fileobj, select.POLLIN)
+        return set(fd for fd, events in poller.poll(None if interval is None else interval * 1000.0))
+
+    #
+    # Accept the pending connections, at most limit. When the serve
+    # callable is specified, first wait for a pending connection (see
+    # _wait()). Accept the connections without blocking, until no
+    # connection is pending anymore (EAGAIN). Return a list of (socket,
+    # address) tuples, which is empty when no connection is pending.
+    #
+    def _accept_connections(self, limit, serve=None):
+        accepted = []
+        if limit <= 0 or (serve is not None and self._socket.fileno() not in self._wait(serve, [self._socket])):
+            return accepted
+        try:
+            while len(accepted) < limit:
+                connection_socket, address = self._socket.accept()
+                connection_socket.setblocking(True)                            # Some platforms inherit the non-blocking mode.
+                accepted.append((connection_socket, address))
+        except (BlockingIOError, InterruptedError):
+            pass
+        return accepted
+
+    #
+    # Run the handler for an accepted connection, catch the exit
+    # status and handle exceptions. When the handler exits, the
+    # connection is shutdown/closed. When the handler returns an
+    # integral return value, it is returned. Otherwise the return
+    # value is set to 0.
+    #
+    def _handle_connection(self, connection_socket, address, disconnect):
+        status = 0
+        try:
+            try:
+                logger.info("%s: serve_until() -- Incoming connection from: %s.", type(self).__name__, str(address))
+                status = self._handler(Connection.create(self._server_type, connection_socket, address, disconnect))
+            except socket.error as e:
+                if e.errno in [errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE]:
+                    logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
+                else:
+                    raise e
+        except Exception as e:
+            logger.exception("%s: serve_until() -- %s", type(self).__name__, e)
+        finally:
+            logger.info("%s: serve_until() -- Closed connection from: %s.", type(self).__name__, str(address))
+            self._close_connection(connection_socket)                          # Always shutdown/close the connection properly.
+            if not isinstance(status, int):
+                status = 0                                                     # When status is not integral, overrule.
+        return status
+
     #
     # Return True when address is a valid IPv4 address.
     #
@@ -83,33 +202,27 @@ class _SocketServer(Server):
 # Define a forking socket server.
 #
 class _ForkingSocketServer(_SocketServer):
+    def __init__(self, server_type, family, type_, address, handler, max_connections, backlog, exit_handler):
+        if exit_handler is not None and not callable(exit_handler):
+            raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "exit_handler")
+        super(_ForkingSocketServer, self).__init__(server_type, family, type_, address, handler, max_connections, backlog)
+        self._exit_handler = exit_handler
+
     #
-    # Return True when the parent process
-    # requests a disconnect.
+    # Called in the parent process when the handler of a connection
+    # exited. The status is the return value of the handler, or the
+    # negative signal number when the child process was killed.
     #
-    @staticmethod
-    def _disconnect(pipe_read):
-        #
-        # Closure function.
-        #
-        # When the parent send the 'disconnect' message
-        # this indicates that we are requested to disconnect
-        # from the client and terminate the handler.
-        #
-        def _closure():
-            disconnect = False
-            if pipe_read.poll():
-                message = pipe_read.recv_bytes()
-                if message.decode() == 'disconnect':
-                    disconnect = True
-            return disconnect
-        return _closure
+    def _handler_exited(self, address, status):
+        logger.info("%s: serve_until() -- Handler for: %s exited with status: %d.", type(self).__name__, str(address), status)
+        if self._exit_handler is not None:
+            self._exit_handler(address, status)
 
     #
     # Run the server forever.
     #
     def serve_forever(self):
-        self.serve_until(lambda: True)
+        self.serve_until(self._forever)
 
     #
     # Run the socket server as long as the serve callable returns True.
@@ -119,82 +232,57 @@ class _ForkingSocketServer(_SocketServer):
     #
     # When the handler exits, the connection is shutdown/closed. When
     # the handler returns an integral return value, it is returned to the
-    # parent process. Otherwise the return value is set to 0. The return
-    # value is currently unused.
+    # parent process. Otherwise the return value is set to 0. The parent
+    # process reaps a child as soon as it exits, and passes the return
+    # value to the exit handler. Upon exit, the children are requested
+    # to disconnect and are waited for.
     #
     def serve_until(self, serve):
         if not callable(serve):
             raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
-        children = []
-        self._socket.listen(1)
-        while serve():
+        children = _ChildWatcher()
+        disconnect = DisconnectEvent()
+        self._socket.listen(self._backlog)
+        log_max_connections = True
+        while self._serving(serve):
+            #
+            # Reap the children that exited and pass the exit
+            # status of their handlers to the exit handler.
+            #
+            for pid, status, address in children.reap():
+                self._handler_exited(address, status)
+            if len(children) >= self._max_connections:
+                if log_max_connections:
+                    logger.info("%s: serve_until() -- Maximum number of connections (%d) reached.", type(self).__name__, self._max_connections)
+                    log_max_connections = False
+                children.wait([self._shutdown], self._serve_interval(serve))  # Wait until a child exits.
+                continue
+            log_max_connections = True
             logging.info("%s: serve_until() -- Waiting for connection at: %s.", type(self).__name__, str(self._address))
-            try:
-                connection, address = self._socket.accept()
-            except socket.timeout:
+            if self._socket.fileno() not in children.wait([self._shutdown, self._socket], self._serve_interval(serve)):
                 continue
-            pipe_read, pipe_write = Pipe(False)                        # Create an unidirectional pipe; only send data from parent to child process.
-            pid = os.fork()
-            if pid < 0:
-                raise ServerError(E_PROCESS_CREATION_ERROR, _error2string[E_PROCESS_CREATION_ERROR])
-            elif pid == 0:
-                status = 0                                             # Path executed in the child process.
-                try:
+            for connection, address in self._accept_connections(self._max_connections - len(children)):
+                pid = os.fork()
+                if pid < 0:
+                    raise ServerError(E_PROCESS_CREATION_ERROR, _error2string[E_PROCESS_CREATION_ERROR])
+                elif pid == 0:
+                    status = 0                                         # Path executed in the child process.
                     try:
-                        #
-                        # Call the connection handler.
-                        #
-                        logger.info("%s: serve_until() -- Incoming connection from: %s.", type(self).__name__, str(address))
-                        status = self._handler(Connection.create(self._server_type, connection, address, self._disconnect(pipe_read)))
-                    except socket.error as e:
-                        if e.errno in [errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE]:
-                            logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
-                        else:
-                            raise e
-                except Exception as e:
-                    logger.exception("%s: serve_until() -- %s", type(self).__name__, e)
-                finally:
-                    logger.info("%s: serve_until() -- Closed connection from: %s.", type(self).__name__, str(address))
-                    self._close_connection(connection)                 # Always shutdown/close the connection properly.
-                    pipe_read.close()                                  # Close our end of the pipe.
-                    if not isinstance(status, int):
-                        status = 0                                     # When status is not integral, overrule.
-                    # noinspection PyProtectedMember
-                    os._exit(status)                                   # Exit the child process.
-            else:
-                children.append((pid, pipe_write))                     # Path executed in the parent process.
-                log_max_connections = True
-                while serve():
-                    for pid, pipe_write in children[:]:
-                        finished_pid = 0
-                        try:
-                            finished_pid, finished_status = os.waitpid(pid, os.WNOHANG)
-                        except OSError as e:
-                            if e.errno != errno.ECHILD:
-                                raise e
-                            #
-                            # The child process does not exist anymore. It can
-                            # therefore definitely be removed from the list of
-                            # children.
-                            #
-                            finished_pid = pid
-                        finally:
-                            if finished_pid != 0:
-                                pipe_write.close()                     # Close our end of the pipe.
-                                children.remove((finished_pid, pipe_write))
-                    if len(children) < self._max_connections:          # Wait until we can accept connections again.
-                        break
-                    if log_max_connections:
-                        logger.info("%s: serve_until() -- Maximum number of connections (%d) reached.", type(self).__name__, self._max_connections)
-                        log_max_connections = False
-                    time.sleep(0.01)                                   # Throttle.
+                        status = self._handle_connection(connection, address, disconnect)
+                    finally:
+                        # noinspection PyProtectedMember
+                        os._exit(status)                               # Exit the child process.
+                else:
+                    connection.close()                                 # Path executed in the parent process; the child owns the connection.
+                    children.add(pid, address)
         #
         # Request the children to disconnect from their
         # client and terminate the handler.
         #
-        for pid, pipe_write in children:
-            pipe_write.send_bytes('disconnect'.encode())               # Send the disconnect message.
-            pipe_write.close()                                         # Close out end of the pipe.
+        disconnect.set()
+        for pid, status, address in children.reap_all():
+            self._handler_exited(address, status)
+        disconnect.close()
 
 
 #
@@ -208,9 +296,10 @@ class _ThreadingSocketServer(_SocketServer):
         # noinspection PyDefaultArgument
         def __init__(self, group=None, target=None, name=None, args=(), kwargs={}, *, daemon=None):
             super(_ThreadingSocketServer.HandlerThread, self).__init__(group=group, target=None, name=name, args=args, kwargs=kwargs, daemon=daemon)
-            self._connection, self._close_connection, self._socket, self._address = args
+            self._connection, self._close_connection, self._socket, self._address, self._wakeup = args
             self._target = target
             self._status = 0
+            self._finished = False
 
         #
         # Run the handler, catch the exit status and handle exceptions.
@@ -231,6 +320,8 @@ class _ThreadingSocketServer(_SocketServer):
                 self._close_connection(self._socket)                           # Always shutdown/close the connection properly.
                 if not isinstance(self._status, int):
                     self._status = 0
+                self._finished = True
+                self._wakeup.wake()                                            # Wake up the server; a connection slot is free.
 
         #
         # Return the exit status of the handler.
@@ -239,11 +330,18 @@ class _ThreadingSocketServer(_SocketServer):
         def status(self):
             return self._status
 
+        #
+        # Return True when the handler has finished.
+        #
+        @property
+        def finished(self):
+            return self._finished
+
     #
     # Run the server forever.
     #
     def serve_forever(self):
-        self.serve_until(lambda: True)
+        self.serve_until(self._forever)
 
     #
     # Run the socket server as long as the serve callable returns True.
@@ -259,25 +357,25 @@ class _ThreadingSocketServer(_SocketServer):
         if not callable(serve):
             raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
         threads = []
-        self._socket.listen(1)
-        while serve():
+        wakeup = _WakeupPipe()
+        monitor = _ServeMonitor(self, serve)
+        self._socket.listen(self._backlog)
+        while self._serving(serve):
             logging.info("%s: serve_until() -- Waiting for connection at: %s.", type(self).__name__, str(self._address))
-            try:
-                connection_socket, address = self._socket.accept()
-            except socket.timeout:
-                continue
-            #
-            # Start the connection handler in a new thread.
-            #
-            logger.info("%s: serve_until() -- Incoming connection from: %s.", type(self).__name__, str(address))
-            connection = Connection.create(self._server_type, connection_socket, address, lambda: not serve())
-            thread = _ThreadingSocketServer.HandlerThread(target=self._handler, args=(connection, self._close_connection, connection_socket, address))
-            thread.start()
-            threads.append(thread)
+            for connection_socket, address in self._accept_connections(self._max_connections - len(threads), serve):
+                #
+                # Start the connection handler in a new thread.
+                #
+                logger.info("%s: serve_until() -- Incoming connection from: %s.", type(self).__name__, str(address))
+                connection = Connection.create(self._server_type, connection_socket, address, monitor.disconnect)
+                thread = _ThreadingSocketServer.HandlerThread(target=self._handler, args=(connection, self._close_connection, connection_socket, address, wakeup))
+                thread.start()
+                threads.append(thread)
             log_max_connections = True
-            while serve():
+            while self._serving(serve):
+                wakeup.drain()
                 for thread in threads[:]:
-                    if not thread.is_alive():
+                    if thread.finished:
                         #
                         # Here, thread.status contains the handler's exit status.
                         #
@@ -287,12 +385,131 @@ class _ThreadingSocketServer(_SocketServer):
                 if log_max_connections:
                     logger.info("%s: serve_until() -- Maximum number of connections (%d) reached.", type(self).__name__, self._max_connections)
                     log_max_connections = False
-                time.sleep(0.1)                                        # Throttle.
+                self._wait(serve, [wakeup])                            # Wait until a handler finishes.
         #
-        # Wait for all threads are stopped.
+        # Request the handlers to disconnect, and wait
+        # for all threads are stopped.
         #
+        monitor.disconnect.set()
         for thread in threads:
             thread.join()
+        monitor.close()
+        wakeup.close()
+
+
+#
+# Define a pooled threading socket server.
+#
+class _PooledSocketServer(_SocketServer):
+    _overflow_policies = ('block', 'reject', 'timeout')
+
+    def __init__(self, server_type, family, type_, address, handler, workers, queue_size, overflow, overflow_timeout, backlog):
+        if overflow not in self._overflow_policies:
+            raise ServerError(E_INVALID_OVERFLOW_POLICY, _error2string[E_INVALID_OVERFLOW_POLICY] % overflow)
+        super(_PooledSocketServer, self).__init__(server_type, family, type_, address, handler, max(1, workers), backlog)
+        self._queue_size = max(1, queue_size)
+        self._overflow = overflow
+        self._overflow_timeout = overflow_timeout
+
+    #
+    # Run the server forever.
+    #
+    def serve_forever(self):
+        self.serve_until(self._forever)
+
+    #
+    # Handle the queued connections until None is dequeued. Wake up
+    # slots for each dequeued connection, as a slot in the queue has
+    # become free.
+    #
+    def _worker(self, connections, disconnect, slots):
+        while True:
+            item = connections.get()
+            slots.wake()
+            if item is None:
+                break
+            connection_socket, address = item
+            status = self._handle_connection(connection_socket, address, disconnect)
+            UNUSED(status)
+
+    #
+    # Queue an accepted connection according to the overflow policy.
+    # Return False when the connection could not be queued. With the
+    # block policy, the server sleeps until a worker frees a slot (slots
+    # is woken up) or the server is shut down; the serve callable is
+    # re-evaluated every serve interval.
+    #
+    def _enqueue(self, connections, item, serve, slots):
+        if self._overflow == 'block':
+            interval = self._serve_interval(serve)
+            poller = select.poll()
+            poller.register(slots, select.POLLIN)
+            poller.register(self._shutdown, select.POLLIN)
+            while self._serving(serve):
+                slots.drain()                                                  # Before trying, so no wakeup is missed.
+                try:
+                    connections.put_nowait(item)
+                    return True
+                except queue.Full:
+                    pass
+                poller.poll(None if interval is None else interval * 1000.0)
+            return False
+        try:
+            connections.put(item, self._overflow == 'timeout', self._overflow_timeout)
+        except queue.Full:
+            return False
+        return True
+
+    #
+    # Run the socket server as long as the serve callable returns True.
+    # Start _max_connections worker threads that handle the accepted
+    # connections, one at a time each. Accepted connections wait in a
+    # queue of at most queue size connections. When the queue is full,
+    # the overflow policy applies:
+    #
+    # * block  : stop accepting until a connection can be queued.
+    # * reject : close the connection.
+    # * timeout: wait at most overflow timeout seconds for a free slot,
+    #            then close the connection.
+    #
+    # When the handler exits, the connection is shutdown/closed. The
+    # return value of the handler is currently unused.
+    #
+    def serve_until(self, serve):
+        if not callable(serve):
+            raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
+        connections = queue.Queue(self._queue_size)
+        disconnect = DisconnectEvent()
+        slots = _WakeupPipe()                                                  # Woken up when a worker dequeues a connection.
+        workers = [threading.Thread(target=self._worker, args=(connections, disconnect, slots)) for _ in range(self._max_connections)]
+        for worker in workers:
+            worker.start()
+        self._socket.listen(self._backlog)
+        try:
+            while self._serving(serve):
+                logging.info("%s: serve_until() -- Waiting for connection at: %s.", type(self).__name__, str(self._address))
+                for connection_socket, address in self._accept_connections(self._queue_size, serve):
+                    if not self._enqueue(connections, (connection_socket, address), serve, slots):
+                        logger.info("%s: serve_until() -- Connection queue full (%d), rejected connection from: %s.", type(self).__name__, self._queue_size, str(address))
+                        self._close_connection(connection_socket)
+        finally:
+            #
+            # Request the workers to disconnect from their client, close
+            # the connections that were not handled yet and stop the workers.
+            #
+            disconnect.set()
+            while True:
+                try:
+                    connection_socket, address = connections.get_nowait()
+                except queue.Empty:
+                    break
+                self._close_connection(connection_socket)
+            for worker in workers:
+                connections.put(None)
+            for worker in workers:
+                worker.join()
+            disconnect.close()
+            slots.close()
 
 
 #
@@ -303,7 +520,7 @@ class _IterativeSocketServer(_SocketServer):
     # Run the server forever.
     #
     def serve_forever(self):
-        self.serve_until(lambda: True)
+        self.serve_until(self._forever)
 
     #
     # Accept a connection, handle it and  then handle the next connection.
@@ -316,13 +533,14 @@ class _IterativeSocketServer(_SocketServer):
     def serve_until(self, serve):
         if not callable(serve):
             raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
-        self._socket.listen(1)
-        while serve():
+        monitor = _ServeMonitor(self, serve)
+        self._socket.listen(self._backlog)
+        while self._serving(serve):
             logging.info("%s: serve_until() -- Waiting for connection at: %s.", type(self).__name__, str(self._address))
-            try:
-                client_socket, address = self._socket.accept()
-            except socket.timeout:
+            accepted = self._accept_connections(1, serve)
+            if len(accepted) == 0:
                 continue
+            client_socket, address = accepted[0]
             status = 0                                                 # Path executed in the child process.
             try:
                 try:
@@ -330,7 +548,7 @@ class _IterativeSocketServer(_SocketServer):
                     # Call the connection handler.
                     #
                     logger.info("%s: serve_forever() -- Incoming connection from: %s.", type(self).__name__, str(address))
-                    status = self._handler(Connection.create(self._server_type, client_socket, address, lambda: not serve()))
+                    status = self._handler(Connection.create(self._server_type, client_socket, address, monitor.disconnect))
                 except socket.error as e:
                     if e.errno in [errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE]:
                         logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
@@ -344,75 +562,491 @@ class _IterativeSocketServer(_SocketServer):
                 if not isinstance(status, int):
                     status = 0                                         # When status is not integral, overrule.
             UNUSED(status)
+        monitor.close()
+
+
+#
+# Define an evented socket server.
+#
+class _EventedSocketServer(_SocketServer):
+    #
+    # Run the server forever.
+    #
+    def serve_forever(self):
+        self.serve_until(self._forever)
+
+    #
+    # Update the events a connection is registered for. Only
+    # modify the registration when the events actually change.
+    #
+    @staticmethod
+    def _update_events(selector, connection_socket, connection, closing):
+        events = selectors.EVENT_WRITE if connection._write_pending else 0
+        if not closing:
+            events |= selectors.EVENT_READ
+        if events != selector.get_key(connection_socket).events:
+            selector.modify(connection_socket, events, connection)
+
+    #
+    # Unregister and shutdown/close a connection.
+    #
+    def _close_evented_connection(self, selector, connections, connection_socket):
+        address, connection, closing = connections.pop(connection_socket)
+        logger.info("%s: serve_until() -- Closed connection from: %s.", type(self).__name__, str(address))
+        selector.unregister(connection_socket)
+        self._close_connection(connection_socket)
+
+    #
+    # Call the handler for a connection that received data. Return
+    # the exit status of the handler; None when the handler wants to
+    # be called again when more data arrives.
+    #
+    def _call_handler(self, connection, address):
+        status = 1
+        try:
+            try:
+                status = self._handler(connection)
+            except socket.error as e:
+                if e.errno in [errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE]:
+                    logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
+                else:
+                    raise e
+        except Exception as e:
+            logger.exception("%s: serve_until() -- %s", type(self).__name__, e)
+        return status
+
+    #
+    # Run the socket server as long as the serve callable returns True.
+    # All connections are multiplexed in a single selector loop; neither
+    # fork() nor create threads. Do not accept more then _max_connections
+    # at the same time.
+    #
+    # The handler is called with the connection each time data is
+    # received, and it must not block. The evented connection queues
+    # sent data and returns received data, and complete lines, only
+    # when these are available. As long as the handler returns None,
+    # the connection is kept open. When the handler returns any other
+    # value (its exit status), the queued data is sent and the connection
+    # is shutdown/closed.
+    #
+    def serve_until(self, serve):
+        if not callable(serve):
+            raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
+        connections = {}
+        selector = selectors.DefaultSelector()
+        chunk = memoryview(bytearray(65536))                                   # Receive buffer shared by all connections.
+        self._socket.listen(self._backlog)
+        selector.register(self._socket, selectors.EVENT_READ)
+        selector.register(self._shutdown, selectors.EVENT_READ)
+        disconnect = DisconnectEvent()                                         # Set when the server stops serving.
+        accepting = True
+        try:
+            logging.info("%s: serve_until() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
+            while self._serving(serve):
+                for key, events in selector.select(self._serve_interval(serve)):
+                    if key.fileobj is self._shutdown:
+                        break
+                    if key.fileobj is self._socket:
+                        for connection_socket, address in self._accept_connections(self._max_connections - len(connections)):
+                            logger.info("%s: serve_until() -- Incoming connection from: %s.", type(self).__name__, str(address))
+                            connection = Connection.create_evented(self._server_type, connection_socket, address, disconnect)
+                            connections[connection_socket] = (address, connection, False)
+                            selector.register(connection_socket, selectors.EVENT_READ, connection)
+                        continue
+                    connection_socket, connection = key.fileobj, key.data
+                    if connection_socket not in connections:
+                        continue                                               # Closed earlier during this iteration.
+                    address, connection, closing = connections[connection_socket]
+                    try:
+                        if events & selectors.EVENT_WRITE:
+                            connection._write_ready()
+                        if events & selectors.EVENT_READ and not closing:
+                            connected = connection._read_ready(chunk)
+                            status = self._call_handler(connection, address)
+                            if status is not None:
+                                #
+                                # Here, status contains the handler's exit status.
+                                #
+                                closing = True
+                                connections[connection_socket] = (address, connection, closing)
+                            if not connected:
+                                raise socket.error(errno.ECONNRESET, os.strerror(errno.ECONNRESET))
+                            if not closing:
+                                connection._check_buffer_overflow()            # The handler leaves a full receive buffer.
+                    except (socket.error, ConnectionError) as e:
+                        logger.info("%s: serve_until() -- %s.", type(self).__name__, e)
+                        self._close_evented_connection(selector, connections, connection_socket)
+                        continue
+                    if closing and not connection._write_pending:
+                        self._close_evented_connection(selector, connections, connection_socket)
+                    else:
+                        self._update_events(selector, connection_socket, connection, closing)
+                #
+                # Stop accepting connections while the maximum number
+                # of connections is reached.
+                #
+                if accepting and len(connections) >= self._max_connections:
+                    logger.info("%s: serve_until() -- Maximum number of connections (%d) reached.", type(self).__name__, self._max_connections)
+                    selector.unregister(self._socket)
+                    accepting = False
+                elif not accepting and len(connections) < self._max_connections:
+                    selector.register(self._socket, selectors.EVENT_READ)
+                    accepting = True
+        finally:
+            #
+            # Shutdown/close all remaining connections.
+            #
+            disconnect.set()
+            for connection_socket in list(connections):
+                self._close_evented_connection(selector, connections, connection_socket)
+            selector.close()
+            disconnect.close()
+
+
+#
+# Define a pre-forking socket server.
+#
+class _PreforkingSocketServer(_SocketServer):
+    _restart_delay = 1.0
+
+    def __init__(self, server_type, family, type_, address, handler, workers, max_requests_per_worker, backlog):
+        workers = os.cpu_count() if workers is None else max(1, workers)
+        super(_PreforkingSocketServer, self).__init__(server_type, family, type_, address, handler, workers, backlog)
+        self._max_requests_per_worker = max_requests_per_worker
+
+    #
+    # Run the server forever.
+    #
+    def serve_forever(self):
+        self.serve_until(self._forever)
+
+    #
+    # Accept and handle connections in a worker process, one at a time,
+    # until max_requests_per_worker connections have been handled, or
+    # until the disconnect event is set. All workers accept on the same
+    # listening socket; the worker that loses the race for a connection
+    # simply waits for the next one.
+    #
+    def _worker(self, disconnect):
+        self._socket.setblocking(False)
+        poller = select.poll()
+        poller.register(self._socket, select.POLLIN)
+        poller.register(disconnect, select.POLLIN)
+        handled = 0
+        while self._max_requests_per_worker is None or handled < self._max_requests_per_worker:
+            ready = dict(poller.poll())
+            if disconnect.fileno() in ready:
+                break
+            try:
+                connection_socket, address = self._socket.accept()
+            except (socket.timeout, BlockingIOError, InterruptedError):
+                continue                                                       # Another worker accepted the connection.
+            handled += 1
+            self._handle_connection(connection_socket, address, disconnect)
+
+    #
+    # Fork a worker process. Return its process id.
+    #
+    def _fork_worker(self, disconnect):
+        pid = os.fork()
+        if pid < 0:
+            raise ServerError(E_PROCESS_CREATION_ERROR, _error2string[E_PROCESS_CREATION_ERROR])
+        elif pid == 0:
+            status = 0                                                         # Path executed in the child process.
+            try:
+                self._worker(disconnect)
+            except Exception as e:
+                logger.exception("%s: serve_until() -- %s", type(self).__name__, e)
+                status = 1
+            finally:
+                # noinspection PyProtectedMember
+                os._exit(status)                                               # Exit the child process.
+        return pid
+
+    #
+    # Run the socket server as long as the serve callable returns True.
+    # Fork _max_connections long-lived worker processes that accept and
+    # handle connections, one at a time each. A worker exits after it
+    # handled max_requests_per_worker connections (when not None) and
+    # is then replaced by a new worker. A worker that fails shortly
+    # after it was forked is replaced after _restart_delay seconds.
+    #
+    # When the handler exits, the connection is shutdown/closed. The
+    # return value of the handler is currently unused.
+    #
+    def serve_until(self, serve):
+        if not callable(serve):
+            raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
+        disconnect = DisconnectEvent()
+        workers = _ChildWatcher()
+        self._socket.listen(self._backlog)
+        logging.info("%s: serve_until() -- Waiting for connections at: %s.", type(self).__name__, str(self._address))
+        try:
+            while self._serving(serve):
+                while len(workers) < self._max_connections:
+                    workers.add(self._fork_worker(disconnect), time.monotonic())   # Path executed in the parent process.
+                workers.wait([self._shutdown], self._serve_interval(serve))    # Wait until a worker exits.
+                for pid, status, started in workers.reap():                    # Replaced in the next iteration.
+                    logger.info("%s: serve_until() -- Worker %d exited with status %d, restarting.", type(self).__name__, pid, status)
+                    if status != 0 and time.monotonic() - started < self._restart_delay:
+                        self._shutdown.wait(self._restart_delay)               # Do not restart a failing worker in a tight loop.
+        finally:
+            #
+            # Request the workers to disconnect from their
+            # client and wait until they have exited.
+            #
+            disconnect.set()
+            workers.reap_all()
+            disconnect.close()
+
+
+#
+# Define a sharded socket server. The server itself does not bind the
+# address; it supervises shard processes that each run their own
+# server with a socket bound to the same address (SO_REUSEPORT).
+#
+class _ShardedSocketServer(Server):
+    _restart_delay = _PreforkingSocketServer._restart_delay
+
+    def __init__(self, server_type, address, handler, shards, shard_factory):
+        super(_ShardedSocketServer, self).__init__(server_type, address, handler)
+        self._shards = os.cpu_count() if shards is None else max(1, shards)
+        self._shard_factory = shard_factory
+
+    #
+    # Run the server forever.
+    #
+    def serve_forever(self):
+        self.serve_until(self._forever)
+
+    #
+    # Fork a shard process that runs its own server until the
+    # disconnect event is set. Return its process id.
+    #
+    def _fork_shard(self, disconnect):
+        pid = os.fork()
+        if pid < 0:
+            raise ServerError(E_PROCESS_CREATION_ERROR, _error2string[E_PROCESS_CREATION_ERROR])
+        elif pid == 0:
+            status = 0                                                         # Path executed in the child process.
+            try:
+                server = self._shard_factory()
+                threading.Thread(target=lambda: (disconnect.wait(), server.shutdown()), daemon=True).start()
+                server.serve_forever()
+            except Exception as e:
+                logger.exception("%s: serve_until() -- %s", type(self).__name__, e)
+                status = 1
+            finally:
+                # noinspection PyProtectedMember
+                os._exit(status)                                               # Exit the child process.
+        return pid
+
+    #
+    # Run the shards as long as the serve callable returns True. Fork
+    # _shards shard processes and restart a shard when it exits. Upon
+    # exit, the shards are requested to stop and are waited for.
+    #
+    def serve_until(self, serve):
+        if not callable(serve):
+            raise ServerError(E_PARAMETER_IS_NOT_CALLABLE, _error2string[E_PARAMETER_IS_NOT_CALLABLE] % "serve")
+        disconnect = DisconnectEvent()
+        shards = _ChildWatcher()
+        logging.info("%s: serve_until() -- Starting %d shards at: %s.", type(self).__name__, self._shards, str(self._address))
+        try:
+            while self._serving(serve):
+                while len(shards) < self._shards:
+                    shards.add(self._fork_shard(disconnect), time.monotonic()) # Path executed in the parent process.
+                shards.wait([self._shutdown], self._serve_interval(serve))     # Wait until a shard exits.
+                for pid, status, started in shards.reap():
+                    logger.info("%s: serve_until() -- Shard %d exited with status %d, restarting.", type(self).__name__, pid, status)
+                    if status != 0 and time.monotonic() - started < self._restart_delay:
+                        self._shutdown.wait(self._restart_delay)               # Do not restart a failing shard in a tight loop.
+        finally:
+            #
+            # Request the shards to stop and wait
+            # until they have exited.
+            #
+            disconnect.set()
+            shards.reap_all()
+            disconnect.close()
 
 
 #
 # Define a forking TCP/IP socket server.
 #
 class _ForkingTCPSocketServer(_ForkingSocketServer):
-    def __init__(self, server_type, handler, address, port, max_connections):
+    def __init__(self, server_type, handler, address, port, max_connections, backlog, exit_handler):
         if not self._is_ip_address(address):
             raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
         if not isinstance(port, int):
             raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
-        super(_ForkingTCPSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, max_connections)
+        super(_ForkingTCPSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, max_connections, backlog, exit_handler)
 
 
 #
 # Define a forking Unix socket server.
 #
 class _ForkingUNIXSocketServer(_ForkingSocketServer):
-    def __init__(self, server_type, handler, path, max_connections):
+    def __init__(self, server_type, handler, path, max_connections, backlog, exit_handler):
         if self._is_socket(path):
             os.remove(path)
         elif os.path.exists(path):
             raise ServerError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
-        super(_ForkingUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, max_connections)
+        super(_ForkingUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, max_connections, backlog, exit_handler)
 
 
 #
 # Define a threading TCP/IP socket server.
 #
 class _ThreadingTCPSocketServer(_ThreadingSocketServer):
-    def __init__(self, server_type, handler, address, port, max_connections):
+    def __init__(self, server_type, handler, address, port, max_connections, backlog):
         if not self._is_ip_address(address):
             raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
         if not isinstance(port, int):
             raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
-        super(_ThreadingTCPSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, max_connections)
+        super(_ThreadingTCPSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, max_connections, backlog)
 
 
 #
 # Define a threading Unix socket server.
 #
 class _ThreadingUNIXSocketServer(_ThreadingSocketServer):
-    def __init__(self, server_type, handler, path, max_connections):
+    def __init__(self, server_type, handler, path, max_connections, backlog):
         if self._is_socket(path):
             os.remove(path)
         elif os.path.exists(path):
             raise ServerError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
-        super(_ThreadingUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, max_connections)
+        super(_ThreadingUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, max_connections, backlog)
 
 
 #
 # Define an iterative TCP/IP socket server.
 #
 class _IterativeTCPSocketServer(_IterativeSocketServer):
-    def __init__(self, server_type, handler, address, port):
+    def __init__(self, server_type, handler, address, port, backlog):
         if not self._is_ip_address(address):
             raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
         if not isinstance(port, int):
             raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
-        super(_IterativeSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, 1)
+        super(_IterativeSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, 1, backlog)
 
 
 #
 # Define an iterative Unix socket server.
 #
 class _IterativeUNIXSocketServer(_IterativeSocketServer):
-    def __init__(self, server_type, handler, path):
+    def __init__(self, server_type, handler, path, backlog):
         if self._is_socket(path):
             os.remove(path)
         elif os.path.exists(path):
             raise ServerError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
-        super(_IterativeUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, 1)
+        super(_IterativeUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, 1, backlog)
+
+
+#
+# Define an evented TCP/IP socket server.
+#
+class _EventedTCPSocketServer(_EventedSocketServer):
+    def __init__(self, server_type, handler, address, port, max_connections, backlog):
+        if not self._is_ip_address(address):
+            raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
+        if not isinstance(port, int):
+            raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
+        super(_EventedTCPSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, max_connections, backlog)
+
+
+#
+# Define an evented Unix socket server.
+#
+class _EventedUNIXSocketServer(_EventedSocketServer):
+    def __init__(self, server_type, handler, path, max_connections, backlog):
+        if self._is_socket(path):
+            os.remove(path)
+        elif os.path.exists(path):
+            raise ServerError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
+        super(_EventedUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, max_connections, backlog)
+
+
+#
+# Define a pre-forking TCP/IP socket server.
+#
+class _PreforkingTCPSocketServer(_PreforkingSocketServer):
+    def __init__(self, server_type, handler, address, port, workers, max_requests_per_worker, backlog):
+        if not self._is_ip_address(address):
+            raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
+        if not isinstance(port, int):
+            raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
+        super(_PreforkingTCPSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, workers, max_requests_per_worker, backlog)
+
+
+#
+# Define a pre-forking Unix socket server.
+#
+class _PreforkingUNIXSocketServer(_PreforkingSocketServer):
+    def __init__(self, server_type, handler, path, workers, max_requests_per_worker, backlog):
+        if self._is_socket(path):
+            os.remove(path)
+        elif os.path.exists(path):
+            raise ServerError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
+        super(_PreforkingUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, workers, max_requests_per_worker, backlog)
+
+
+#
+# Define a pooled threading TCP/IP socket server.
+#
+class _PooledTCPSocketServer(_PooledSocketServer):
+    def __init__(self, server_type, handler, address, port, workers, queue_size, overflow, overflow_timeout, backlog):
+        if not self._is_ip_address(address):
+            raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
+        if not isinstance(port, int):
+            raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
+        super(_PooledTCPSocketServer, self).__init__(server_type, socket.AF_INET, socket.SOCK_STREAM, (address, port), handler, workers, queue_size, overflow, overflow_timeout, backlog)
+
+
+#
+# Define a pooled threading Unix socket server.
+#
+class _PooledUNIXSocketServer(_PooledSocketServer):
+    def __init__(self, server_type, handler, path, workers, queue_size, overflow, overflow_timeout, backlog):
+        if self._is_socket(path):
+            os.remove(path)
+        elif os.path.exists(path):
+            raise ServerError(E_PATH_EXISTS_BUT_NOT_SOCKET, _error2string[E_PATH_EXISTS_BUT_NOT_SOCKET] % path)
+        super(_PooledUNIXSocketServer, self).__init__(server_type, socket.AF_UNIX, socket.SOCK_STREAM, path, handler, workers, queue_size, overflow, overflow_timeout, backlog)
+
+
+#
+# Define the TCP/IP socket servers that run in a shard.
+#
+class _ShardIterativeTCPSocketServer(_IterativeTCPSocketServer):
+    _reuse_port = True
+
+
+class _ShardThreadingTCPSocketServer(_ThreadingTCPSocketServer):
+    _reuse_port = True
+
+
+class _ShardEventedTCPSocketServer(_EventedTCPSocketServer):
+    _reuse_port = True
+
+
+#
+# Define a sharded TCP/IP socket server. Each shard runs a server
+# of the specified model (iterative, threading or evented), which
+# is created with the specified options.
+#
+class _ShardedTCPSocketServer(_ShardedSocketServer):
+    def __init__(self, server_type, handler, address, port, shards, model, backlog, options):
+        if not _SocketServer._is_ip_address(address):
+            raise ServerError(E_INVALID_IP_ADDRESS, _error2string[E_INVALID_IP_ADDRESS] % address)
+        if not isinstance(port, int):
+            raise ServerError(E_INTEGRAL_PORT, _error2string[E_INTEGRAL_PORT] % port)
+        _model2class = {
+            'iterative': lambda: _ShardIterativeTCPSocketServer(server_type, handler, address, port, backlog),
+            'threading': lambda max_connections=1: _ShardThreadingTCPSocketServer(server_type, handler, address, port, max_connections, backlog),
+            'evented': lambda max_connections=1024: _ShardEventedTCPSocketServer(server_type, handler, address, port, max_connections, backlog)
+        }
+        if model not in _model2class:
+            raise ServerError(E_INVALID_SHARD_MODEL, _error2string[E_INVALID_SHARD_MODEL] % model)
+        inspect.signature(_model2class[model]).bind(**options)                 # Raise a TypeError for invalid options here, not in every shard.
+        super(_ShardedTCPSocketServer, self).__init__(server_type, (address, port), handler, shards, lambda: _model2class[model](**options))
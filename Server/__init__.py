@@ -1,2 +1,3 @@
 from .Server import Server, ServerError
 from .Errors import *
+from .AsyncServer import AsyncServer
@@ -37,6 +37,7 @@ def main():
     logging.basicConfig(level=logging.INFO)
     # client = Client.create('unix', handler, '/home/elbert/server', 5.0)
     # client = Client.create('serial', handler, '/dev/ttyUSB1', rtscts=True, baudrate=115200)
+    # client = Client.create('serial', handler, '/tmp/ttyV1', 1.5, baudrate=115200)     # The VirtualSerialPair of TestServer.py.
     client = TimedClient()
     client.start()
     time.sleep(60.0)
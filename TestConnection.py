@@ -0,0 +1,102 @@
+import socket
+import asyncio
+import unittest
+from Connection import Connection, AsyncConnection
+
+
+#
+# Compare the lines received by the blocking and the asyncio
+# connections, for the universal newlines and custom delimiters.
+#
+class TestReceiveLine(unittest.TestCase):
+    _inputs = [b'a\nb\nc\n', b'a\rb\rc\r', b'a\r\nb\r\nc\r\n', b'a\rb\nc\r\nd\n']
+    _delimiters = [None, '\n', '\r', '\r\n']
+
+    #
+    # Return the lines received by a blocking connection.
+    #
+    @staticmethod
+    def _blocking_lines(data, delimiter, count):
+        sender, receiver = socket.socketpair()
+        try:
+            sender.sendall(data)
+            sender.shutdown(socket.SHUT_WR)
+            connection = Connection.create('unix', receiver, None, lambda: False)
+            return [connection.receive_line(delimiter=delimiter) for _ in range(count)]
+        finally:
+            sender.close()
+            receiver.close()
+
+    #
+    # Return the lines received by an asyncio connection.
+    #
+    @staticmethod
+    def _async_lines(data, delimiter, count):
+        async def receive():
+            sender, receiver = socket.socketpair()
+            sender.sendall(data)
+            sender.shutdown(socket.SHUT_WR)
+            reader, writer = await asyncio.open_unix_connection(sock=receiver)
+            connection = AsyncConnection.create('unix', reader, writer, None)
+            try:
+                return [await connection.receive_line(delimiter=delimiter) for _ in range(count)]
+            finally:
+                await connection.close()
+                sender.close()
+        return asyncio.run(receive())
+
+    def test_async_matches_blocking(self):
+        for data in self._inputs:
+            for delimiter in self._delimiters:
+                with self.subTest(data=data, delimiter=delimiter):
+                    count = data.count(b'\n' if delimiter is None else delimiter.encode())
+                    if delimiter is None:
+                        count = len(data.replace(b'\r\n', b'\n').replace(b'\r', b'\n').splitlines())
+                    self.assertEqual(self._async_lines(data, delimiter, count), self._blocking_lines(data, delimiter, count))
+
+    def test_delimiters(self):
+        self.assertEqual(self._async_lines(b'a\rb\rc\r', '\r', 2), ['a\r', 'b\r'])
+        self.assertEqual(self._async_lines(b'a\r\nb\r\n', '\r\n', 2), ['a\r\n', 'b\r\n'])
+        self.assertEqual(self._async_lines(b'a\rb\r\nc\n', None, 3), ['a\n', 'b\n', 'c\n'])
+
+
+#
+# Check that receive() returns the data that the line
+# reader has already read ahead.
+#
+class TestReceive(unittest.TestCase):
+    def test_receive_after_line(self):
+        sender, receiver = socket.socketpair()
+        try:
+            sender.sendall(b'line1\nrest-of-stream')
+            connection = Connection.create('unix', receiver, None, lambda: False)
+            self.assertEqual(connection.receive_line(), 'line1\n')
+            self.assertEqual(connection.receive(timeout=1.0), 'rest-of-stream')
+        finally:
+            sender.close()
+            receiver.close()
+
+
+#
+# Check that the buffered writer never modifies the buffers
+# of the caller.
+#
+class TestBufferedWriter(unittest.TestCase):
+    def test_large_buffer_not_modified(self):
+        sender, receiver = socket.socketpair()
+        try:
+            connection = Connection.create('unix', sender, None, lambda: False)
+            large = bytearray(b'x' * 2000)
+            with connection.buffered_writer() as writer:
+                writer.write(large)
+                writer.write(b'abc')
+            self.assertEqual(large, bytearray(b'x' * 2000))
+            received = Connection.create('unix', receiver, None, lambda: False).receive_exactly(2003)
+            self.assertEqual(bytes(received), b'x' * 2000 + b'abc')
+        finally:
+            sender.close()
+            receiver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
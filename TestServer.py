@@ -2,45 +2,62 @@ import threading
 import logging
 import time
 from Server import Server
+from Connection import VirtualSerialPair
 
 
 def echo_server(connection):
     connection.send('Hello\n')
+    for lines in connection.receive_lines(batch=True):
+        replies = []
+        for line in lines:
+            if line.strip() == 'quit':
+                connection.send(''.join(replies))
+                return 0
+            replies.append(line.upper())
+        connection.send(''.join(replies))
+    return 0
+
+
+def evented_echo_server(connection):
     for line in connection.receive_lines():
         if line.strip() == 'quit':
-            break
+            return 0
         connection.send(line.upper())
-    return 0
+    return None
 
 
 class TimedServer(threading.Thread):
     def __init__(self, **kwargs):
         super(TimedServer, self).__init__(**kwargs)
-        self._keep_running = False
 #       self._server = Server.create_forking('tcp', echo_server, '127.0.0.1', 8080, max_connections=1)
         self._server = Server.create_threading('serial', echo_server, '/dev/ttyUSB0')
 
-    def start(self):
-        self._keep_running = True
-        super(TimedServer, self).start()
-
     def run(self):
-        self._server.serve_until(lambda: self._keep_running)
+        self._server.serve_forever()
 
     def stop(self):
-        self._keep_running = False
+        self._server.shutdown()
 
 
 def main():
     logging.basicConfig(level=logging.INFO)
     # server = Server.create_forking('unix', echo_server, '/home/elbert/server', max_connections=2)
     # server = Server.create_forking('serial', echo_server, '/dev/ttyUSB0', rtscts=True, baudrate=115200)
+    # server = Server.create_preforking('tcp', echo_server, '127.0.0.1', 8080, workers=4, max_requests_per_worker=1000)
+    # server = Server.create_preforking('unix', echo_server, '/home/elbert/server', workers=4, max_requests_per_worker=1000)
     # server = Server.create_threading('tcp', echo_server, '127.0.0.1', 8080, max_connections=2)
     # server = Server.create_threading('unix', echo_server, '/home/elbert/server', max_connections=2)
     # server = Server.create_threading('serial', echo_server, '/dev/ttyUSB0', rtscts=True, baudrate=115200)
+    # server = Server.create_pooled('tcp', echo_server, '127.0.0.1', 8080, workers=8, queue_size=64, overflow='reject')
+    # server = Server.create_pooled('unix', echo_server, '/home/elbert/server', workers=8, queue_size=64, overflow='block')
+    # server = Server.create_sharded('tcp', echo_server, '127.0.0.1', 8080, shards=4, model='threading', max_connections=16)
+    # server = Server.create_evented('tcp', evented_echo_server, '127.0.0.1', 8080, max_connections=1024)
+    # server = Server.create_evented('unix', evented_echo_server, '/home/elbert/server', max_connections=1024)
     # server = Server.create_iterative('tcp', echo_server, '127.0.0.1', 8080)
     # server = Server.create_iterative('unix', echo_server, '/home/elbert/server')
     # server = Server.create_iterative('serial', echo_server, '/dev/ttyUSB0', rtscts=True, baudrate=115200)
+    # pair = VirtualSerialPair(('/tmp/ttyV0', '/tmp/ttyV1'), baudrate=115200)     # No serial devices; TestClient.py connects to /tmp/ttyV1.
+    # server = Server.create_threading('serial', echo_server, '/tmp/ttyV0', baudrate=115200)
     server = TimedServer()
     server.start()
     time.sleep(20.0)
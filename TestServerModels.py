@@ -0,0 +1,230 @@
+import os
+import time
+import socket
+import tempfile
+import threading
+import unittest
+import serial
+from Server import Server
+from Connection import Connection, Multiplexer, VirtualSerialPair
+
+
+#
+# Reply to each line with the line in upper case.
+#
+def echo_handler(connection):
+    while True:
+        connection.send(connection.receive_line().upper())
+
+
+#
+# Reply to each line with the line in upper case, until
+# no complete line is buffered (evented servers).
+#
+def evented_echo_handler(connection):
+    for line in connection.receive_lines():
+        connection.send(line.upper())
+    return None
+
+
+#
+# Round trip a few lines through each server model: start the server
+# in a thread, connect to it, and shut it down again.
+#
+class TestServerModels(unittest.TestCase):
+    _connect_timeout = 5.0
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._directory.name, 'server')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    #
+    # Return a free TCP port on the loopback interface.
+    #
+    @staticmethod
+    def _free_port():
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            probe.bind(('127.0.0.1', 0))
+            return probe.getsockname()[1]
+
+    #
+    # Connect to address, retrying until the server listens.
+    #
+    def _connect(self, family, address):
+        deadline = time.monotonic() + self._connect_timeout
+        while True:
+            client = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                client.connect(address)
+                return client
+            except (FileNotFoundError, ConnectionRefusedError):
+                client.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    #
+    # Run server in a thread, send lines on the connections of clients to
+    # address, and check the replies. Shut the server down afterwards.
+    #
+    def _round_trip(self, server, family, address, clients=2, lines=3):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for index in range(clients):
+                client = self._connect(family, address)
+                try:
+                    connection = Connection.create('tcp' if family == socket.AF_INET else 'unix', client, address, lambda: False)
+                    for line in range(lines):
+                        connection.send('client %d line %d\n' % (index, line))
+                        self.assertEqual(connection.receive_line(), 'CLIENT %d LINE %d\n' % (index, line))
+                finally:
+                    client.close()
+        finally:
+            server.shutdown()
+            thread.join(self._connect_timeout)
+            if getattr(server, '_socket', None) is not None:
+                server._socket.close()                                         # The listening socket is only closed when collected.
+        self.assertFalse(thread.is_alive())
+
+    def test_iterative(self):
+        self._round_trip(Server.create_iterative('unix', echo_handler, self._path), socket.AF_UNIX, self._path)
+
+    def test_threading(self):
+        self._round_trip(Server.create_threading('unix', echo_handler, self._path, max_connections=2), socket.AF_UNIX, self._path)
+
+    def test_forking(self):
+        self._round_trip(Server.create_forking('unix', echo_handler, self._path, max_connections=2), socket.AF_UNIX, self._path)
+
+    def test_preforking(self):
+        self._round_trip(Server.create_preforking('unix', echo_handler, self._path, workers=2, max_requests_per_worker=1), socket.AF_UNIX, self._path, clients=3)
+
+    def test_pooled(self):
+        for overflow in ['block', 'reject', 'timeout']:
+            with self.subTest(overflow=overflow):
+                self._round_trip(Server.create_pooled('unix', echo_handler, self._path, workers=2, queue_size=2, overflow=overflow), socket.AF_UNIX, self._path, clients=3)
+
+    def test_evented(self):
+        self._round_trip(Server.create_evented('unix', evented_echo_handler, self._path), socket.AF_UNIX, self._path)
+
+    def test_sharded(self):
+        port = self._free_port()
+        self._round_trip(Server.create_sharded('tcp', echo_handler, '127.0.0.1', port, shards=2, max_connections=2), socket.AF_INET, ('127.0.0.1', port))
+
+
+#
+# Check the flow control of the multiplexer: a channel that is not read
+# never receives more than its window, and does not block the other
+# channels.
+#
+class TestMultiplexer(unittest.TestCase):
+    _window = 16384
+
+    def setUp(self):
+        client_socket, server_socket = socket.socketpair()
+        self._sockets = [client_socket, server_socket]
+        self._client = Multiplexer(Connection.create('unix', client_socket, None, lambda: False), True, self._window)
+        self._server = Multiplexer(Connection.create('unix', server_socket, None, lambda: False), False, self._window)
+
+    def tearDown(self):
+        closers = [threading.Thread(target=multiplexer.close, args=(1.0,)) for multiplexer in [self._client, self._server]]
+        for closer in closers:
+            closer.start()
+        for closer in closers:
+            closer.join()
+        for socket_ in self._sockets:
+            socket_.close()
+
+    def test_round_trip(self):
+        channel = self._client.open()
+        accepted = self._server.accept(1.0)
+        channel.send('ping\n')
+        self.assertEqual(accepted.receive_line(), 'ping\n')
+        accepted.send('pong\n')
+        self.assertEqual(channel.receive_line(), 'pong\n')
+
+    def test_window(self):
+        blocked = self._client.open()
+        free = self._client.open()
+        blocked_peer = self._server.accept(1.0)
+        free_peer = self._server.accept(1.0)
+        data = b'x' * (3 * self._window)
+        sender = threading.Thread(target=blocked.send, args=(data, None), daemon=True)
+        sender.start()
+        sender.join(0.5)
+        self.assertTrue(sender.is_alive())                                     # More than the window is queued; the sender waits.
+        free.send(b'free', None)
+        self.assertEqual(bytes(free_peer.receive_exactly(4, timeout=1.0)), b'free')
+        self.assertLessEqual(len(blocked_peer._protocol), self._window)
+        received = bytes(blocked_peer.receive_exactly(len(data), timeout=5.0))
+        sender.join(1.0)
+        self.assertFalse(sender.is_alive())
+        self.assertEqual(received, data)
+
+    def test_close_timeout(self):
+        silent_socket, other_socket = socket.socketpair()
+        try:
+            multiplexer = Multiplexer(Connection.create('unix', silent_socket, None, lambda: False))
+            started = time.monotonic()
+            multiplexer.close(0.2)
+            self.assertLess(time.monotonic() - started, 2.0)                   # The peer never confirms the close.
+        finally:
+            silent_socket.close()
+            other_socket.close()
+
+
+#
+# Check that a virtual serial pair carries data in both directions,
+# paced at its baudrate, and flips bits at its bit error rate.
+#
+class TestVirtualSerialPair(unittest.TestCase):
+    @staticmethod
+    def _transfer(ports, data, timeout=5.0):
+        sender = serial.Serial(ports[0], timeout=0.1)
+        receiver = serial.Serial(ports[1], timeout=0.1)
+        try:
+            sender.write(data)
+            received = bytearray()
+            deadline = time.monotonic() + timeout
+            while len(received) < len(data) and time.monotonic() < deadline:
+                received += receiver.read(len(data) - len(received))
+            return bytes(received)
+        finally:
+            sender.close()
+            receiver.close()
+
+    def test_both_directions(self):
+        with VirtualSerialPair() as pair:
+            self.assertEqual(self._transfer(pair.ports, b'a' * 10000), b'a' * 10000)
+            self.assertEqual(self._transfer(pair.ports[::-1], b'b' * 10000), b'b' * 10000)
+
+    def test_baudrate(self):
+        with VirtualSerialPair(baudrate=50000) as pair:
+            started = time.monotonic()
+            self.assertEqual(self._transfer(pair.ports, b'c' * 2500), b'c' * 2500)
+            self.assertGreaterEqual(time.monotonic() - started, 0.4)           # 2500 bytes of 10 bits take 0.5 seconds.
+
+    def test_bit_errors(self):
+        with VirtualSerialPair(bit_error_rate=0.01, seed=1) as pair:
+            received = self._transfer(pair.ports, bytes(10000))
+        self.assertEqual(len(received), 10000)
+        flipped = sum(bin(byte).count('1') for byte in received)
+        self.assertTrue(400 < flipped < 1200)                                  # About 800 of 80000 bits.
+
+    def test_connection(self):
+        with VirtualSerialPair() as pair:
+            sender = serial.Serial(pair.ports[0], timeout=0.1)
+            receiver = serial.Serial(pair.ports[1], timeout=0.1)
+            try:
+                Connection.create('serial', sender, lambda: False).send_message(b'message')
+                self.assertEqual(bytes(Connection.create('serial', receiver, lambda: False).receive_message(timeout=5.0)), b'message')
+            finally:
+                sender.close()
+                receiver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()